@@ -0,0 +1,103 @@
+from common.model import Packet
+
+import socket
+import time
+
+
+class DatagramIOBenchmark:
+    def __init__(
+        self, total_pkts: int = 20000, chunk_size: int = 256, rounds: int = 5
+    ) -> None:
+        self.__total_pkts = total_pkts
+        self.__chunk_size = chunk_size
+        self.__rounds = rounds
+
+        self.__receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 25)
+        self.__receiver.bind(("127.0.0.1", 0))
+        self.__receiver.setblocking(False)
+        self.__address = self.__receiver.getsockname()
+
+        self.__sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 25)
+
+        self.__pkts = [
+            Packet(
+                seq_number=i, total_pkts=total_pkts, payload=bytes(chunk_size)
+            ).encode_buffers()
+            for i in range(total_pkts)
+        ]
+
+    def execute(self) -> None:
+        # Joining header and payload for sendto against sending them apart
+        # with sendmsg, and receiving into new bytes against a reused buffer
+        print(f"{self.__total_pkts} packets of {self.__chunk_size} bytes per round")
+        print(f"{'send path':<24}{'pkt/s':>12}{'receive path':>24}{'pkt/s':>12}")
+
+        for send_name, send, receive_name, receive in (
+            ("sendto(join(buffers))", self.__send_joined, "recvfrom", self.__receive),
+            (
+                "sendmsg(buffers)",
+                self.__send_scattered,
+                "recvfrom_into",
+                self.__receive_into,
+            ),
+        ):
+            best_send = 0.0
+            best_receive = 0.0
+
+            for _ in range(self.__rounds):
+                start = time.perf_counter()
+                sent = send()
+                best_send = max(best_send, sent / (time.perf_counter() - start))
+
+                start = time.perf_counter()
+                received = receive()
+                best_receive = max(
+                    best_receive, received / (time.perf_counter() - start)
+                )
+
+            print(
+                f"{send_name:<24}{best_send:>12,.0f}"
+                f"{receive_name:>24}{best_receive:>12,.0f}"
+            )
+
+    def __send_joined(self) -> int:
+        for buffers in self.__pkts:
+            self.__sender.sendto(b"".join(buffers), self.__address)
+
+        return len(self.__pkts)
+
+    def __send_scattered(self) -> int:
+        for buffers in self.__pkts:
+            self.__sender.sendmsg(buffers, [], 0, self.__address)
+
+        return len(self.__pkts)
+
+    def __receive(self) -> int:
+        received = 0
+
+        while True:
+            try:
+                self.__receiver.recvfrom(Packet.max_datagram_size(self.__chunk_size))
+                received += 1
+
+            except BlockingIOError:
+                return received
+
+    def __receive_into(self) -> int:
+        buffer = bytearray(Packet.max_datagram_size(self.__chunk_size))
+        received = 0
+
+        while True:
+            try:
+                self.__receiver.recvfrom_into(buffer)
+                received += 1
+
+            except BlockingIOError:
+                return received
+
+
+if __name__ == "__main__":
+    benchmark = DatagramIOBenchmark()
+    benchmark.execute()
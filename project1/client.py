@@ -1,10 +1,19 @@
-from common.model import ClientRequest
-from common.utils import CalculateChecksum
+from common.model import (
+    ClientRequest,
+    ETHERNET_DATAGRAM_SIZE,
+    MAX_DATAGRAM_SIZE,
+    Packet,
+    PacketFlag,
+)
+from common.protocol import ParityDecoder, SelectiveRepeatReceiver
+from common.utils import CalculateChecksum, DrainingSocket, MerkleTree, PathMtu
+from typing import Optional
 
 import json
 import os
 import shutil
 import socket
+import time
 
 
 class Client:
@@ -12,65 +21,69 @@ class Client:
         self,
         server_ip: str = "localhost",
         server_port: int = 8082,
-        chunk_size: int = 256,
+        chunk_size: Optional[int] = None,
+        probe_path_mtu: bool = False,
+        ack_every: int = 2,
+        ack_delay: float = 0.02,
+        linger_time: float = 0.5,
+        receive_timeout: float = 10.0,
+        request_timeout: float = 0.5,
+        fec_block_size: Optional[int] = None,
     ) -> None:
 
         self.__client_address = ""
         self.__checksum = ""
-        self.__temporary_file_buffer = {}
+        self.__checksum_algorithm = "sha256"
+        self.__merkle_root = None
+        self.__leaves = bytearray()
         self.__base_path = "client_files/"
         self.__output_file = ""
         self.__server_address = (server_ip, server_port)
-        self.__chunk_size = chunk_size
+        self.__requested_chunk_size = chunk_size
+        self.__probe_path_mtu = probe_path_mtu
+        self.__chunk_size = 0
+
+        # Asks for one parity packet every fec_block_size chunks, so a lost
+        # chunk per block is rebuilt without a retransmission
+        self.__fec_block_size = fec_block_size
+        self.__ack_every = ack_every
+        self.__ack_delay = ack_delay
+        self.__linger_time = linger_time
+        self.__receive_timeout = receive_timeout
+        self.__request_timeout = request_timeout
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__sock.settimeout(10000)
+        self.__draining_sock = DrainingSocket(sock=self.__sock)
 
     def execute(self) -> None:
         while True:
-            self.__temporary_file_buffer = {}
-
             file_name = str(input("File name: "))
             discarded_pkts = int(input("Discarded packets: "))
             transfer_object = ClientRequest(
-                file_name=file_name, discarded_pkts=discarded_pkts
+                file_name=file_name,
+                discarded_pkts=discarded_pkts,
+                chunk_size=self.__get_requested_chunk_size(),
+                fec_block_size=self.__fec_block_size,
             )
             data_sent = json.dumps(transfer_object.__dict__)
 
             try:
-                self.__sock.sendto(
-                    data_sent.encode("iso-8859-1"), self.__server_address
-                )
-                data, _ = self.__sock.recvfrom(self.__chunk_size)
-                data = data.decode("iso-8859-1")
-
-                if "client_address" in data:
-                    self.__client_address = str(json.loads(data).get("client_address"))
-
-                    data, _ = self.__sock.recvfrom(self.__chunk_size)
-                    data = data.decode("iso-8859-1")
-
-                    if "checksum" in data:
-                        self.__output_file = file_name
-                        self.__checksum = json.loads(data).get("checksum")
-                        self.__receive_file()
-                        self.__build_file()
-
-                        if not self.__check_file_integrity(checksum=self.__checksum):
-                            retransmission = str(
-                                input(
-                                    "Do you want to retransmit the lost packets? [y/n] "
-                                )
-                            ).lower()
-
-                            if retransmission == "y":
-                                self.__retransmit_lost_pkts()
-                                self.__receive_lost_pkts()
-                                self.__clear_client_folder()
-                                self.__build_file()
-                                self.__check_file_integrity(checksum=self.__checksum)
-
-                else:
-                    print(data)
+                data = self.__request_file(request=data_sent.encode("iso-8859-1"))
+
+                if data is not None:
+                    self.__output_file = file_name
+                    self.__checksum = data.get("checksum")
+                    self.__checksum_algorithm = data.get("algorithm", "sha256")
+                    self.__merkle_root = data.get("merkle_root")
+                    self.__chunk_size = data.get(
+                        "chunk_size", transfer_object.chunk_size
+                    )
+                    self.__receive_file(
+                        total_pkts=int(data.get("total_pkts")),
+                        size=int(data.get("size")),
+                        fec_block_size=data.get("fec_block_size"),
+                    )
+                    self.__check_file_integrity(checksum=self.__checksum)
 
             except socket.error as e:
                 print(f"Socket error: {str(e)}")
@@ -88,36 +101,253 @@ class Client:
         self.__clear_client_folder()
         self.__sock.close()
 
-    def __build_file(self) -> None:
+    def __request_file(self, request: bytes) -> Optional[dict]:
+        # The request is sent again until the server answers with our
+        # address, the metadata then follows and is repeated by the server
+        # until our first acknowledgement
+        client_address = None
+        self.__sock.settimeout(self.__request_timeout)
+        deadline = time.monotonic() + self.__receive_timeout
+        self.__sock.sendto(request, self.__server_address)
+        request_time = time.monotonic()
+
+        try:
+            while time.monotonic() < deadline:
+                if (
+                    client_address is None
+                    and time.monotonic() - request_time >= self.__request_timeout
+                ):
+                    self.__sock.sendto(request, self.__server_address)
+                    request_time = time.monotonic()
+
+                try:
+                    data, _ = self.__sock.recvfrom(MAX_DATAGRAM_SIZE)
+
+                except socket.timeout:
+                    continue
+
+                if Packet.is_packet(data):
+                    # Chunks that overtook the metadata, or leftovers of the
+                    # previous transfer
+                    continue
+
+                data = data.decode("iso-8859-1")
+
+                if "client_address" in data:
+                    client_address = str(json.loads(data).get("client_address"))
+
+                elif "checksum" in data:
+                    # Without our address the server is asked again
+                    if client_address is not None:
+                        self.__client_address = client_address
+                        return json.loads(data)
+
+                else:
+                    print(data)
+                    return None
+
+            raise socket.timeout("timed out")
+
+        finally:
+            self.__sock.settimeout(10000)
+
+    def __get_requested_chunk_size(self) -> int:
+        if self.__requested_chunk_size is not None:
+            return self.__requested_chunk_size
+
+        datagram_size = ETHERNET_DATAGRAM_SIZE
+
+        if self.__probe_path_mtu:
+            path_mtu = PathMtu.execute(*self.__server_address)
+
+            if path_mtu is not None:
+                datagram_size = min(path_mtu, MAX_DATAGRAM_SIZE)
+
+        return Packet.max_chunk_size(datagram_size)
+
+    def __open_output_file(self, size: int) -> int:
         os.makedirs(self.__base_path + self.__client_address + "/", exist_ok=True)
 
-        with open(
-            self.__base_path + self.__client_address + "/" + self.__output_file, "wb"
-        ) as file:
-            for pkt_number in sorted(self.__temporary_file_buffer.keys(), key=int):
-                chunk = self.__temporary_file_buffer[pkt_number]
-                if chunk != b"EOF":
-                    file.write(chunk)
+        fd = os.open(
+            self.__base_path + self.__client_address + "/" + self.__output_file,
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+        )
+
+        # Chunks are written at their offsets as they arrive, so the file
+        # gets its final size up front
+        if size and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+
+        else:
+            os.ftruncate(fd, size)
 
-    def __receive_file(self) -> None:
-        continue_receiving = True
+        return fd
 
-        while continue_receiving:
-            pkt_number, _ = self.__sock.recvfrom(self.__chunk_size)
-            pkt_number = pkt_number.decode("iso-8859-1")
+    def __write_chunk(self, fd: int, seq_number: int, payload: memoryview) -> None:
+        offset = seq_number * self.__chunk_size
+
+        if hasattr(os, "pwrite"):
+            os.pwrite(fd, payload, offset)
+
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, payload)
+
+    def __receive_file(
+        self, total_pkts: int, size: int, fec_block_size: Optional[int]
+    ) -> None:
+        fd = self.__open_output_file(size=size)
+        receiver = SelectiveRepeatReceiver(total_pkts=total_pkts)
+        parity_decoder = (
+            ParityDecoder(
+                total_pkts=total_pkts,
+                chunk_size=self.__chunk_size,
+                size=size,
+                block_size=fec_block_size,
+            )
+            if fec_block_size
+            else None
+        )
+        self.__leaves = bytearray(total_pkts * MerkleTree.DIGEST_SIZE)
+        corrupted_pkts = 0
+        recovered_pkts = 0
+        unacked_pkts = 0
+        idle_time = 0.0
+
+        self.__sock.setblocking(False)
+
+        try:
+            while not receiver.complete:
+                try:
+                    datagrams = self.__draining_sock.drain_views(
+                        buffer_size=Packet.max_datagram_size(self.__chunk_size),
+                        timeout=self.__ack_delay,
+                    )
+
+                except socket.timeout:
+                    idle_time += self.__ack_delay
+                    if idle_time >= self.__receive_timeout:
+                        raise
+
+                    # Delayed acknowledgement, also repeated while the server
+                    # is silent in case the previous one was lost
+                    self.__send_ack(receiver=receiver)
+                    unacked_pkts = 0
+                    continue
+
+                idle_time = 0.0
+
+                for datagram, _ in datagrams:
+                    if not Packet.is_packet(datagram):
+                        continue
+
+                    pkt = Packet.decode(datagram)
+
+                    if pkt.digest and MerkleTree.hash_leaf(pkt.payload) != pkt.digest:
+                        # Left unacknowledged so only this chunk is sent again
+                        corrupted_pkts += 1
+                        continue
+
+                    recovered = None
+
+                    if pkt.flags & PacketFlag.PARITY:
+                        if parity_decoder is not None:
+                            recovered = parity_decoder.on_parity(
+                                block=pkt.seq_number, parity=pkt.payload
+                            )
+
+                    elif receiver.on_packet(seq_number=pkt.seq_number):
+                        self.__write_chunk(
+                            fd=fd, seq_number=pkt.seq_number, payload=pkt.payload
+                        )
+                        if pkt.digest:
+                            self.__set_leaf(
+                                seq_number=pkt.seq_number, digest=pkt.digest
+                            )
+                        unacked_pkts += 1
+
+                        if parity_decoder is not None:
+                            recovered = parity_decoder.on_chunk(
+                                seq_number=pkt.seq_number, chunk=pkt.payload
+                            )
+
+                    else:
+                        # Duplicate, our acknowledgement was probably lost
+                        unacked_pkts = self.__ack_every
+
+                    if recovered is not None and receiver.on_packet(
+                        seq_number=recovered[0]
+                    ):
+                        # Rebuilt from the parity, the Merkle root check at
+                        # the end covers it
+                        seq_number, chunk = recovered
+                        self.__write_chunk(fd=fd, seq_number=seq_number, payload=chunk)
+                        self.__set_leaf(
+                            seq_number=seq_number, digest=MerkleTree.hash_leaf(chunk)
+                        )
+                        recovered_pkts += 1
+                        unacked_pkts += 1
+
+                # One acknowledgement covers the whole batch
+                if unacked_pkts >= self.__ack_every or receiver.has_gaps:
+                    self.__send_ack(receiver=receiver)
+                    unacked_pkts = 0
+
+            self.__send_ack(receiver=receiver)
+            self.__linger(receiver=receiver)
+
+        finally:
+            self.__sock.settimeout(10000)
+            os.close(fd)
+
+        if corrupted_pkts:
+            print(f"{corrupted_pkts} corrupted packets were fetched again")
+
+        if recovered_pkts:
+            print(f"{recovered_pkts} lost packets were rebuilt from parity")
+
+        print("File transfer complete.")
+
+    def __set_leaf(self, seq_number: int, digest: bytes) -> None:
+        offset = seq_number * MerkleTree.DIGEST_SIZE
+        self.__leaves[offset : offset + MerkleTree.DIGEST_SIZE] = digest
+
+    def __linger(self, receiver: SelectiveRepeatReceiver) -> None:
+        # Keep answering retransmissions for a while in case the final
+        # acknowledgement was lost
+        self.__sock.settimeout(self.__linger_time)
+
+        try:
+            while True:
+                datagram, _ = self.__sock.recvfrom(
+                    Packet.max_datagram_size(self.__chunk_size)
+                )
 
-            chunk, _ = self.__sock.recvfrom(self.__chunk_size)
+                if Packet.is_packet(datagram):
+                    self.__send_ack(receiver=receiver)
 
-            if chunk == b"EOF":
-                print("File transfer complete.")
-                continue_receiving = False
+        except socket.timeout:
+            pass
 
-            self.__temporary_file_buffer.update({pkt_number: chunk})
+    def __send_ack(self, receiver: SelectiveRepeatReceiver) -> None:
+        # A full send buffer loses the acknowledgement like the network would
+        self.__draining_sock.send_all(
+            datagrams=[[receiver.acknowledgement().encode()]],
+            address=self.__server_address,
+        )
 
     def __check_file_integrity(self, checksum: str) -> bool:
-        if (
+        # Every chunk was already checked against its leaf digest, so
+        # matching the root verifies the file without hashing it again
+        if self.__merkle_root is not None:
+            if MerkleTree(leaves=self.__leaves).root.hex() != self.__merkle_root:
+                print("File transfer fail: different Merkle root")
+                return False
+
+        elif (
             CalculateChecksum.execute(
-                self.__base_path + self.__client_address + "/" + self.__output_file
+                self.__base_path + self.__client_address + "/" + self.__output_file,
+                algorithm=self.__checksum_algorithm,
             )
             != checksum
         ):
@@ -130,32 +360,6 @@ class Client:
     def __clear_client_folder(self) -> None:
         shutil.rmtree(self.__base_path + self.__client_address + "/")
 
-    def __retransmit_lost_pkts(self) -> None:
-        for pkt_number in self.__temporary_file_buffer.keys():
-            self.__sock.sendto(
-                json.dumps({"Retransmit": pkt_number}).encode("iso-8859-1"),
-                self.__server_address,
-            )
-
-        self.__sock.sendto(
-            "Finished retransmission".encode("iso-8859-1"),
-            self.__server_address,
-        )
-
-    def __receive_lost_pkts(self):
-        continue_receiving = True
-
-        while continue_receiving:
-            pkt_number_rcv, _ = self.__sock.recvfrom(self.__chunk_size)
-            pkt_number_rcv = pkt_number_rcv.decode("utf-8")
-            chunk, _ = self.__sock.recvfrom(self.__chunk_size)
-
-            if pkt_number_rcv == "Finished":
-                continue_receiving = False
-
-            else:
-                self.__temporary_file_buffer.update({pkt_number_rcv: chunk})
-
 
 if __name__ == "__main__":
     client = Client()
@@ -1 +1,3 @@
+from .acknowledgement import Acknowledgement
 from .client_request import ClientRequest
+from .packet import ETHERNET_DATAGRAM_SIZE, MAX_DATAGRAM_SIZE, Packet, PacketFlag
@@ -0,0 +1,48 @@
+from .packet import Packet, PacketFlag
+from dataclasses import dataclass, field
+from typing import List
+
+
+@dataclass
+class Acknowledgement:
+    # Every packet below cumulative_ack has been received
+    cumulative_ack: int
+    # Packets received above cumulative_ack, sent as a bitmap where bit i
+    # stands for packet cumulative_ack + 1 + i
+    selective_acks: List[int] = field(default_factory=list)
+
+    def encode(self) -> bytes:
+        bitmap = bytearray()
+
+        if self.selective_acks:
+            bitmap = bytearray(
+                (max(self.selective_acks) - self.cumulative_ack - 1) // 8 + 1
+            )
+
+            for seq_number in self.selective_acks:
+                bit = seq_number - self.cumulative_ack - 1
+                bitmap[bit // 8] |= 0x80 >> (bit % 8)
+
+        return Packet(
+            seq_number=self.cumulative_ack,
+            total_pkts=0,
+            flags=PacketFlag.ACK,
+            payload=bytes(bitmap),
+        ).encode()
+
+    @classmethod
+    def decode(cls, datagram: bytes) -> "Acknowledgement":
+        pkt = Packet.decode(datagram)
+
+        if not pkt.flags & PacketFlag.ACK:
+            raise ValueError("Not an acknowledgement packet")
+
+        selective_acks = []
+        for byte_index, byte in enumerate(pkt.payload):
+            for bit_index in range(8):
+                if byte & (0x80 >> bit_index):
+                    selective_acks.append(
+                        pkt.seq_number + 1 + byte_index * 8 + bit_index
+                    )
+
+        return cls(cumulative_ack=pkt.seq_number, selective_acks=selective_acks)
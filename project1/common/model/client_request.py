@@ -1,7 +1,10 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class ClientRequest:
     file_name: str
     discarded_pkts: int
+    chunk_size: Optional[int] = None
+    fec_block_size: Optional[int] = None
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from enum import IntFlag
+from typing import List
+
+import struct
+
+
+class PacketFlag(IntFlag):
+    NONE = 0
+    RETRANSMISSION = 1
+    ACK = 2
+    DIGEST = 4
+    PARITY = 8
+
+
+PROTOCOL_VERSION = 1
+
+# Protocol version, sequence number, total number of packets, flags and
+# payload length
+HEADER = struct.Struct("!BIIBH")
+
+# Packets flagged with DIGEST start their payload with a length-prefixed
+# digest of the chunk
+MAX_DIGEST_SIZE = 64
+
+# Largest UDP payload over IPv4, and the largest one that fits an Ethernet
+# frame (1500 bytes minus the IPv4 and UDP headers)
+MAX_DATAGRAM_SIZE = 65507
+ETHERNET_DATAGRAM_SIZE = 1472
+
+
+@dataclass
+class Packet:
+    seq_number: int
+    total_pkts: int
+    flags: PacketFlag = PacketFlag.NONE
+    payload: bytes = b""
+    digest: bytes = b""
+
+    def encode(self) -> bytes:
+        return b"".join(self.encode_buffers())
+
+    def encode_buffers(self) -> List[bytes]:
+        # Header and payload apart, joined into one datagram when sent
+        flags = self.flags
+        prefix = b""
+
+        if self.digest:
+            flags |= PacketFlag.DIGEST
+            prefix = bytes([len(self.digest)]) + self.digest
+
+        header = HEADER.pack(
+            PROTOCOL_VERSION,
+            self.seq_number,
+            self.total_pkts,
+            flags,
+            len(prefix) + len(self.payload),
+        )
+
+        return [header + prefix, self.payload]
+
+    @classmethod
+    def decode(cls, datagram: bytes) -> "Packet":
+        if not cls.is_packet(datagram):
+            raise ValueError("Not a protocol packet")
+
+        _, seq_number, total_pkts, flags, payload_length = HEADER.unpack_from(datagram)
+        payload = datagram[HEADER.size : HEADER.size + payload_length]
+
+        if len(payload) != payload_length:
+            raise ValueError("Truncated packet payload")
+
+        digest = b""
+        if flags & PacketFlag.DIGEST:
+            digest_size = payload[0]
+            digest = payload[1 : 1 + digest_size]
+            payload = payload[1 + digest_size :]
+
+        return cls(
+            seq_number=seq_number,
+            total_pkts=total_pkts,
+            flags=PacketFlag(flags),
+            payload=payload,
+            digest=digest,
+        )
+
+    @classmethod
+    def is_packet(cls, datagram: bytes) -> bool:
+        # Control messages are JSON or plain text, so they never start with
+        # the version byte
+        return len(datagram) >= HEADER.size and datagram[0] == PROTOCOL_VERSION
+
+    @classmethod
+    def max_datagram_size(cls, chunk_size: int) -> int:
+        return HEADER.size + 1 + MAX_DIGEST_SIZE + chunk_size
+
+    @classmethod
+    def max_chunk_size(cls, datagram_size: int) -> int:
+        return datagram_size - HEADER.size - 1 - MAX_DIGEST_SIZE
@@ -0,0 +1,7 @@
+from .congestion_control import CongestionControl
+from .pacer import Pacer
+from .parity import ParityDecoder, ParityEncoder
+from .rtt_estimator import RttEstimator
+from .selective_repeat_receiver import SelectiveRepeatReceiver
+from .selective_repeat_sender import SelectiveRepeatSender
+from .transfer_session import TransferSession, TransferState
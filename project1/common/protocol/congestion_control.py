@@ -0,0 +1,44 @@
+class CongestionControl:
+    def __init__(
+        self,
+        initial_window: float = 4.0,
+        min_window: float = 2.0,
+        max_window: float = 1024.0,
+    ) -> None:
+        self.__min_window = min_window
+        self.__max_window = max_window
+        self.__cwnd = initial_window
+        self.__ssthresh = max_window
+
+        # Losses of packets sent before this sequence number belong to the
+        # same congestion event and only shrink the window once
+        self.__recovery_seq_number = 0
+
+    @property
+    def window(self) -> int:
+        return max(1, int(self.__cwnd))
+
+    def on_ack(self, acked_pkts: int) -> None:
+        if self.__cwnd < self.__ssthresh:
+            # Slow start
+            self.__cwnd += acked_pkts
+
+        else:
+            # Additive increase, about one packet per round trip
+            self.__cwnd += acked_pkts / self.__cwnd
+
+        self.__cwnd = min(self.__cwnd, self.__max_window)
+
+    def on_loss(self, seq_number: int, next_seq_number: int) -> None:
+        if seq_number < self.__recovery_seq_number:
+            return
+
+        # Multiplicative decrease
+        self.__ssthresh = max(self.__cwnd / 2, self.__min_window)
+        self.__cwnd = self.__ssthresh
+        self.__recovery_seq_number = next_seq_number
+
+    def on_timeout(self, next_seq_number: int) -> None:
+        self.__ssthresh = max(self.__cwnd / 2, self.__min_window)
+        self.__cwnd = 1.0
+        self.__recovery_seq_number = next_seq_number
@@ -0,0 +1,33 @@
+class Pacer:
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        # Packets per second, spent from a bucket holding at most burst tokens
+        self.__interval = 1 / rate
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__last_refill = None
+
+    def take(self, now: float) -> bool:
+        self.__refill(now=now)
+
+        if self.__tokens >= 1:
+            self.__tokens -= 1
+            return True
+
+        return False
+
+    def next_send_delay(self, now: float) -> float:
+        self.__refill(now=now)
+
+        if self.__tokens >= 1:
+            return 0.0
+
+        return (1 - self.__tokens) * self.__interval
+
+    def __refill(self, now: float) -> None:
+        if self.__last_refill is not None:
+            self.__tokens = min(
+                self.__burst,
+                self.__tokens + (now - self.__last_refill) / self.__interval,
+            )
+
+        self.__last_refill = now
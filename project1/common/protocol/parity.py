@@ -0,0 +1,112 @@
+from common.utils import Bitmap, ChunkSource
+from typing import Dict, Optional, Set, Tuple
+
+
+def _xor_int(chunk: bytes) -> int:
+    # Little endian, so shorter chunks are zero padded at the end for free
+    return int.from_bytes(chunk, "little")
+
+
+class ParityEncoder:
+    def __init__(self, chunk_source: ChunkSource, block_size: int) -> None:
+        # One XOR parity chunk for every block_size data chunks
+        self.__chunk_source = chunk_source
+        self.block_size = block_size
+
+    def is_block_end(self, seq_number: int) -> bool:
+        return (
+            seq_number % self.block_size == self.block_size - 1
+            or seq_number == self.__chunk_source.total_pkts - 1
+        )
+
+    def block_of(self, seq_number: int) -> int:
+        return seq_number // self.block_size
+
+    def parity(self, block: int) -> bytes:
+        first_seq_number = block * self.block_size
+        last_seq_number = min(
+            first_seq_number + self.block_size, self.__chunk_source.total_pkts
+        )
+        parity = 0
+
+        for seq_number in range(first_seq_number, last_seq_number):
+            parity ^= _xor_int(self.__chunk_source.get_chunk(seq_number))
+
+        return parity.to_bytes(self.__chunk_source.chunk_size, "little")
+
+
+class ParityDecoder:
+    def __init__(
+        self, total_pkts: int, chunk_size: int, size: int, block_size: int
+    ) -> None:
+        self.__total_pkts = total_pkts
+        self.__chunk_size = chunk_size
+        self.__size = size
+        self.__block_size = block_size
+
+        # Only blocks with chunks still missing are tracked: the XOR of
+        # everything received so far, the chunks it covers and whether the
+        # parity is part of it
+        self.__parities: Dict[int, int] = {}
+        self.__received: Dict[int, Set[int]] = {}
+        self.__has_parity: Set[int] = set()
+        self.__finished_blocks = Bitmap((total_pkts + block_size - 1) // block_size)
+
+    def on_chunk(self, seq_number: int, chunk: bytes) -> Optional[Tuple[int, bytes]]:
+        block = seq_number // self.__block_size
+        if self.__finished_blocks[block]:
+            return None
+
+        self.__parities[block] = self.__parities.get(block, 0) ^ _xor_int(chunk)
+        self.__received.setdefault(block, set()).add(seq_number)
+
+        return self.__recover(block=block)
+
+    def on_parity(self, block: int, parity: bytes) -> Optional[Tuple[int, bytes]]:
+        if (
+            block >= len(self.__finished_blocks)
+            or self.__finished_blocks[block]
+            or block in self.__has_parity
+        ):
+            return None
+
+        self.__parities[block] = self.__parities.get(block, 0) ^ _xor_int(parity)
+        self.__received.setdefault(block, set())
+        self.__has_parity.add(block)
+
+        return self.__recover(block=block)
+
+    def __recover(self, block: int) -> Optional[Tuple[int, bytes]]:
+        block_seq_numbers = range(
+            block * self.__block_size,
+            min((block + 1) * self.__block_size, self.__total_pkts),
+        )
+        missing = len(block_seq_numbers) - len(self.__received[block])
+
+        if missing == 0:
+            self.__finish(block=block)
+            return None
+
+        if missing > 1 or block not in self.__has_parity:
+            return None
+
+        # With a single chunk missing the XOR of the rest and the parity is
+        # that chunk
+        seq_number = next(
+            seq_number
+            for seq_number in block_seq_numbers
+            if seq_number not in self.__received[block]
+        )
+        chunk_length = min(
+            self.__chunk_size, self.__size - seq_number * self.__chunk_size
+        )
+        chunk = self.__parities[block].to_bytes(self.__chunk_size, "little")
+
+        self.__finish(block=block)
+        return seq_number, chunk[:chunk_length]
+
+    def __finish(self, block: int) -> None:
+        self.__parities.pop(block, None)
+        self.__received.pop(block, None)
+        self.__has_parity.discard(block)
+        self.__finished_blocks.set(block)
@@ -0,0 +1,52 @@
+from typing import Optional
+
+
+class RttEstimator:
+    # Smoothing factors and variance multiplier from RFC 6298
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(
+        self,
+        initial_rto: float = 0.2,
+        min_rto: float = 0.05,
+        max_rto: float = 10.0,
+        clock_granularity: float = 0.001,
+    ) -> None:
+        self.__min_rto = min_rto
+        self.__max_rto = max_rto
+        self.__clock_granularity = clock_granularity
+        self.__srtt: Optional[float] = None
+        self.__rttvar: Optional[float] = None
+        self.__rto = initial_rto
+
+    @property
+    def rto(self) -> float:
+        return self.__rto
+
+    @property
+    def srtt(self) -> Optional[float]:
+        return self.__srtt
+
+    def on_sample(self, rtt: float) -> None:
+        if self.__srtt is None:
+            self.__srtt = rtt
+            self.__rttvar = rtt / 2
+
+        else:
+            self.__rttvar = (1 - self.BETA) * self.__rttvar + self.BETA * abs(
+                self.__srtt - rtt
+            )
+            self.__srtt = (1 - self.ALPHA) * self.__srtt + self.ALPHA * rtt
+
+        self.__rto = self.__clamp(
+            self.__srtt + max(self.__clock_granularity, self.K * self.__rttvar)
+        )
+
+    def on_timeout(self) -> None:
+        # Exponential backoff until a new sample arrives
+        self.__rto = self.__clamp(self.__rto * 2)
+
+    def __clamp(self, rto: float) -> float:
+        return min(self.__max_rto, max(self.__min_rto, rto))
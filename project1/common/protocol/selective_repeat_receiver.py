@@ -0,0 +1,49 @@
+from common.model import Acknowledgement
+from common.utils import Bitmap
+
+
+class SelectiveRepeatReceiver:
+    def __init__(self, total_pkts: int, max_selective_acks: int = 1024) -> None:
+        self.__total_pkts = total_pkts
+        self.__max_selective_acks = max_selective_acks
+        self.__received = Bitmap(total_pkts)
+        self.__cumulative_ack = 0
+        self.__highest_seq_number = -1
+
+    @property
+    def complete(self) -> bool:
+        return self.__cumulative_ack >= self.__total_pkts
+
+    @property
+    def has_gaps(self) -> bool:
+        return self.__highest_seq_number >= self.__cumulative_ack
+
+    def on_packet(self, seq_number: int) -> bool:
+        if seq_number >= self.__total_pkts or self.__received[seq_number]:
+            return False
+
+        self.__received.set(seq_number)
+        self.__highest_seq_number = max(self.__highest_seq_number, seq_number)
+
+        while (
+            self.__cumulative_ack < self.__total_pkts
+            and self.__received[self.__cumulative_ack]
+        ):
+            self.__cumulative_ack += 1
+
+        return True
+
+    def acknowledgement(self) -> Acknowledgement:
+        last_seq_number = min(
+            self.__highest_seq_number,
+            self.__cumulative_ack + self.__max_selective_acks,
+        )
+
+        return Acknowledgement(
+            cumulative_ack=self.__cumulative_ack,
+            selective_acks=[
+                seq_number
+                for seq_number in range(self.__cumulative_ack + 1, last_seq_number + 1)
+                if self.__received[seq_number]
+            ],
+        )
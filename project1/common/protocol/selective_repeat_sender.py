@@ -0,0 +1,264 @@
+from .congestion_control import CongestionControl
+from .pacer import Pacer
+from .parity import ParityEncoder
+from .rtt_estimator import RttEstimator
+from common.model import Acknowledgement, Packet, PacketFlag
+from common.utils import Bitmap, ChunkSource, MerkleTree
+from typing import Dict, List, Optional, Set
+
+
+class SelectiveRepeatSender:
+    def __init__(
+        self,
+        chunk_source: ChunkSource,
+        window_size: int = 64,
+        max_retransmissions: int = 10,
+        fast_retransmit_threshold: int = 3,
+        discarded_pkts: Optional[Set[int]] = None,
+        rtt_estimator: Optional[RttEstimator] = None,
+        congestion_control: Optional[CongestionControl] = None,
+        pacer: Optional[Pacer] = None,
+        merkle_tree: Optional[MerkleTree] = None,
+        parity_encoder: Optional[ParityEncoder] = None,
+    ) -> None:
+        self.__chunk_source = chunk_source
+
+        # Every chunk travels with its leaf digest when a tree is given
+        self.__merkle_tree = merkle_tree
+        self.__total_pkts = chunk_source.total_pkts
+        self.__window_size = window_size
+        self.__max_retransmissions = max_retransmissions
+        self.__fast_retransmit_threshold = fast_retransmit_threshold
+
+        # A parity packet follows every block, so losses inside a block are
+        # left for the receiver to repair before fast retransmit steps in
+        self.__parity_encoder = parity_encoder
+        if parity_encoder is not None:
+            self.__fast_retransmit_threshold = max(
+                fast_retransmit_threshold, parity_encoder.block_size + 1
+            )
+        self.__rtt_estimator = rtt_estimator or RttEstimator()
+        self.__congestion_control = congestion_control or CongestionControl()
+
+        # Optional fixed sending rate on top of the congestion window
+        self.__pacer = pacer
+
+        # Packets that are "lost" on their first transmission to simulate an
+        # unreliable link
+        self.__discarded_pkts = discarded_pkts or set()
+
+        # Discarded packets go out on the next poll as if that was their
+        # first transmission, a simulated loss is neither congestion nor a
+        # timeout and must not shrink the window or back the RTO off
+        self.__simulated_loss_queue: List[int] = []
+
+        self.__acked = Bitmap(self.__total_pkts)
+        self.__base = 0
+        self.__next_seq_number = 0
+
+        # Retransmission deadline and retry count of every packet in flight
+        self.__timers: Dict[int, float] = {}
+        self.__retransmissions: Dict[int, int] = {}
+
+        # First transmission time of packets that were never retransmitted,
+        # the only ones that give unambiguous RTT samples (Karn's algorithm)
+        self.__send_times: Dict[int, float] = {}
+
+        self.__fast_retransmitted: Set[int] = set()
+        self.__fast_retransmit_queue: List[int] = []
+
+        self.failed = False
+
+    @property
+    def finished(self) -> bool:
+        return self.__base >= self.__total_pkts
+
+    @property
+    def window(self) -> int:
+        return min(self.__window_size, self.__congestion_control.window)
+
+    def poll(self, now: float) -> List[List[bytes]]:
+        datagrams = []
+
+        while self.__simulated_loss_queue and self.__can_send(now=now):
+            seq_number = self.__simulated_loss_queue.pop(0)
+
+            if seq_number in self.__timers:
+                self.__timers[seq_number] = now + self.__rtt_estimator.rto
+                self.__send_times[seq_number] = now
+                datagrams.append(
+                    self.__build_packet(
+                        seq_number=seq_number, flags=PacketFlag.RETRANSMISSION
+                    )
+                )
+
+        while self.__fast_retransmit_queue and self.__can_send(now=now):
+            seq_number = self.__fast_retransmit_queue.pop(0)
+
+            if seq_number in self.__timers:
+                datagrams.append(self.__retransmit(seq_number=seq_number, now=now))
+
+        timed_out = False
+        for seq_number, deadline in sorted(
+            self.__timers.items(), key=lambda timer: timer[1]
+        ):
+            if deadline > now or not self.__can_send(now=now):
+                break
+
+            if self.__retransmissions.get(seq_number, 0) >= self.__max_retransmissions:
+                self.failed = True
+                return []
+
+            if not timed_out:
+                timed_out = True
+                self.__rtt_estimator.on_timeout()
+                self.__congestion_control.on_timeout(
+                    next_seq_number=self.__next_seq_number
+                )
+
+            datagrams.append(self.__retransmit(seq_number=seq_number, now=now))
+
+        while (
+            self.__next_seq_number < self.__total_pkts
+            and self.__next_seq_number < self.__base + self.window
+            and self.__can_send(now=now)
+        ):
+            seq_number = self.__next_seq_number
+            self.__next_seq_number += 1
+            self.__timers[seq_number] = now + self.__rtt_estimator.rto
+            self.__send_times[seq_number] = now
+
+            if seq_number in self.__discarded_pkts:
+                # Later packets overtake it, so their SACKs don't mean it was lost
+                self.__fast_retransmitted.add(seq_number)
+                self.__simulated_loss_queue.append(seq_number)
+
+            else:
+                datagrams.append(self.__build_packet(seq_number=seq_number))
+
+            if (
+                self.__parity_encoder is not None
+                and self.__parity_encoder.is_block_end(seq_number)
+            ):
+                datagrams.append(self.__build_parity_packet(seq_number=seq_number))
+
+        return datagrams
+
+    def on_ack(self, ack: Acknowledgement, now: float) -> None:
+        acked_pkts = 0
+        rtt_sample = None
+
+        for seq_number in range(
+            self.__base, min(ack.cumulative_ack, self.__next_seq_number)
+        ):
+            acked_pkts += self.__mark_acked(seq_number=seq_number)
+
+        for seq_number in ack.selective_acks:
+            if self.__base <= seq_number < self.__next_seq_number:
+                acked_pkts += self.__mark_acked(seq_number=seq_number)
+
+        for seq_number in [
+            *range(self.__base, ack.cumulative_ack),
+            *ack.selective_acks,
+        ]:
+            send_time = self.__send_times.pop(seq_number, None)
+            if send_time is not None:
+                rtt_sample = now - send_time
+
+        if rtt_sample is not None:
+            self.__rtt_estimator.on_sample(rtt=rtt_sample)
+
+        if acked_pkts:
+            self.__congestion_control.on_ack(acked_pkts=acked_pkts)
+
+        while self.__base < self.__total_pkts and self.__acked[self.__base]:
+            self.__base += 1
+
+        # A packet with enough later packets acknowledged is assumed lost and
+        # retransmitted right away instead of waiting for its timer. Small
+        # windows can't produce that many, so the threshold shrinks with them
+        if ack.selective_acks:
+            threshold_seq_number = max(ack.selective_acks) - min(
+                self.__fast_retransmit_threshold, max(1, self.window - 1)
+            )
+
+            for seq_number in sorted(self.__timers):
+                if seq_number > threshold_seq_number:
+                    break
+
+                if seq_number not in self.__fast_retransmitted:
+                    self.__fast_retransmitted.add(seq_number)
+                    self.__fast_retransmit_queue.append(seq_number)
+                    self.__congestion_control.on_loss(
+                        seq_number=seq_number,
+                        next_seq_number=self.__next_seq_number,
+                    )
+
+    def next_timeout(self, now: float) -> Optional[float]:
+        deadlines = list(self.__timers.values())
+
+        if self.__simulated_loss_queue and self.__pacer is None:
+            return 0.0
+
+        if self.__pacer is not None and (
+            self.__simulated_loss_queue
+            or self.__fast_retransmit_queue
+            or (
+                self.__next_seq_number < self.__total_pkts
+                and self.__next_seq_number < self.__base + self.window
+            )
+        ):
+            deadlines.append(now + self.__pacer.next_send_delay(now=now))
+
+        if not deadlines:
+            return None
+
+        return max(0.0, min(deadlines) - now)
+
+    def __can_send(self, now: float) -> bool:
+        return self.__pacer is None or self.__pacer.take(now=now)
+
+    def __retransmit(self, seq_number: int, now: float) -> List[bytes]:
+        self.__retransmissions[seq_number] = (
+            self.__retransmissions.get(seq_number, 0) + 1
+        )
+        self.__timers[seq_number] = now + self.__rtt_estimator.rto
+        self.__send_times.pop(seq_number, None)
+
+        return self.__build_packet(
+            seq_number=seq_number, flags=PacketFlag.RETRANSMISSION
+        )
+
+    def __mark_acked(self, seq_number: int) -> int:
+        if self.__acked[seq_number]:
+            return 0
+
+        self.__acked.set(seq_number)
+        self.__timers.pop(seq_number, None)
+        self.__retransmissions.pop(seq_number, None)
+        self.__fast_retransmitted.discard(seq_number)
+
+        return 1
+
+    def __build_parity_packet(self, seq_number: int) -> List[bytes]:
+        block = self.__parity_encoder.block_of(seq_number)
+        parity = self.__parity_encoder.parity(block)
+
+        return Packet(
+            seq_number=block,
+            total_pkts=self.__total_pkts,
+            flags=PacketFlag.PARITY,
+            payload=parity,
+            digest=MerkleTree.hash_leaf(parity) if self.__merkle_tree else b"",
+        ).encode_buffers()
+
+    def __build_packet(
+        self, seq_number: int, flags: PacketFlag = PacketFlag.NONE
+    ) -> List[bytes]:
+        return Packet(
+            seq_number=seq_number,
+            total_pkts=self.__total_pkts,
+            flags=flags,
+            payload=self.__chunk_source.get_chunk(seq_number),
+            digest=self.__merkle_tree.leaf(seq_number) if self.__merkle_tree else b"",
+        ).encode_buffers()
@@ -0,0 +1,158 @@
+from .pacer import Pacer
+from .parity import ParityEncoder
+from .selective_repeat_sender import SelectiveRepeatSender
+from common.model import Acknowledgement
+from common.utils import CachedFile, ChunkSource
+from concurrent.futures import Future
+from enum import Enum
+from typing import List, Optional, Set
+
+import json
+
+
+class TransferState(Enum):
+    PREPARING = "preparing"
+    TRANSFERRING = "transferring"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+
+class TransferSession:
+    # Sessions waiting for their digests are polled at this interval
+    PREPARING_POLL_INTERVAL = 0.01
+
+    # The metadata is repeated at this interval until the first
+    # acknowledgement shows the client got it
+    METADATA_RESEND_INTERVAL = 0.2
+
+    def __init__(
+        self,
+        cached_file: CachedFile,
+        chunk_size: int,
+        checksum_future: Future,
+        merkle_tree_future: Future,
+        checksum_algorithm: str,
+        discarded_pkts: Set[int],
+        window_size: int,
+        pacing_rate: Optional[float] = None,
+        fec_block_size: Optional[int] = None,
+    ) -> None:
+        self.cached_file = cached_file
+        self.state = TransferState.PREPARING
+
+        self.__chunk_source = ChunkSource(
+            cached_file=cached_file, chunk_size=chunk_size
+        )
+        self.__checksum_future = checksum_future
+        self.__merkle_tree_future = merkle_tree_future
+        self.__checksum_algorithm = checksum_algorithm
+        self.__discarded_pkts = discarded_pkts
+        self.__window_size = window_size
+        self.__pacing_rate = pacing_rate
+        self.__fec_block_size = fec_block_size
+        self.__sender: Optional[SelectiveRepeatSender] = None
+        self.__metadata: Optional[bytes] = None
+        self.__metadata_deadline = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.state in (TransferState.FINISHED, TransferState.FAILED)
+
+    def poll(self, now: float) -> List[List[bytes]]:
+        if self.state == TransferState.PREPARING:
+            return self.__start(now=now)
+
+        if self.state == TransferState.TRANSFERRING:
+            datagrams = self.__sender.poll(now=now)
+
+            if self.__metadata is not None and now >= self.__metadata_deadline:
+                self.__metadata_deadline = now + self.METADATA_RESEND_INTERVAL
+                datagrams.insert(0, [self.__metadata])
+
+            if self.__sender.failed:
+                self.state = TransferState.FAILED
+
+            return datagrams
+
+        return []
+
+    def on_ack(self, ack: Acknowledgement, now: float) -> None:
+        if self.state != TransferState.TRANSFERRING:
+            return
+
+        self.__metadata = None
+        self.__sender.on_ack(ack, now=now)
+
+        if self.__sender.finished:
+            self.state = TransferState.FINISHED
+
+    def next_timeout(self, now: float) -> Optional[float]:
+        if self.state == TransferState.PREPARING:
+            return self.PREPARING_POLL_INTERVAL
+
+        if self.state == TransferState.TRANSFERRING:
+            timeout = self.__sender.next_timeout(now=now)
+
+            if self.__metadata is not None:
+                metadata_timeout = max(0.0, self.__metadata_deadline - now)
+                timeout = (
+                    metadata_timeout
+                    if timeout is None
+                    else min(timeout, metadata_timeout)
+                )
+
+            return timeout
+
+        return None
+
+    def __start(self, now: float) -> List[List[bytes]]:
+        # The client verifies the Merkle root, so the transfer doesn't wait
+        # for the whole-file digest, which is only sent along once known
+        if not self.__merkle_tree_future.done():
+            return []
+
+        if self.__merkle_tree_future.exception():
+            self.state = TransferState.FAILED
+            return []
+
+        merkle_tree = self.__merkle_tree_future.result()
+
+        self.__sender = SelectiveRepeatSender(
+            chunk_source=self.__chunk_source,
+            merkle_tree=merkle_tree,
+            window_size=self.__window_size,
+            discarded_pkts=self.__discarded_pkts,
+            pacer=Pacer(rate=self.__pacing_rate) if self.__pacing_rate else None,
+            parity_encoder=(
+                ParityEncoder(
+                    chunk_source=self.__chunk_source, block_size=self.__fec_block_size
+                )
+                if self.__fec_block_size
+                else None
+            ),
+        )
+        self.state = (
+            TransferState.FINISHED
+            if self.__sender.finished
+            else TransferState.TRANSFERRING
+        )
+
+        self.__metadata = json.dumps(
+            {
+                "checksum": (
+                    self.__checksum_future.result()
+                    if self.__checksum_future.done()
+                    and not self.__checksum_future.exception()
+                    else None
+                ),
+                "algorithm": self.__checksum_algorithm,
+                "merkle_root": merkle_tree.root.hex(),
+                "total_pkts": self.__chunk_source.total_pkts,
+                "chunk_size": self.__chunk_source.chunk_size,
+                "size": self.__chunk_source.size,
+                "fec_block_size": self.__fec_block_size,
+            }
+        ).encode("iso-8859-1")
+        self.__metadata_deadline = now + self.METADATA_RESEND_INTERVAL
+
+        return [[self.__metadata], *self.__sender.poll(now=now)]
@@ -1 +1,7 @@
+from .bitmap import Bitmap
 from .calculate_checksum import CalculateChecksum
+from .chunk_source import ChunkSource
+from .draining_socket import DrainingSocket
+from .file_cache import CachedFile, FileCache
+from .merkle_tree import MerkleTree
+from .path_mtu import PathMtu
@@ -0,0 +1,13 @@
+class Bitmap:
+    def __init__(self, size: int) -> None:
+        self.__size = size
+        self.__bits = bytearray((size + 7) // 8)
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __getitem__(self, index: int) -> bool:
+        return bool(self.__bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def set(self, index: int) -> None:
+        self.__bits[index >> 3] |= 0x80 >> (index & 7)
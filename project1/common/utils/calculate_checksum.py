@@ -1,13 +1,121 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
 import hashlib
+import os
+import threading
 
 
 class CalculateChecksum:
+    # Digests by (path, algorithm), valid while the file keeps the same
+    # inode, modification time and size
+    __cache: Dict[Tuple[str, str], Tuple[Tuple[int, int, int], str]] = {}
+
+    # Hashes still running, so concurrent requests for a file that isn't
+    # cached yet wait on one hash instead of each starting their own
+    __pending: Dict[Tuple[str, str], Tuple[Tuple[int, int, int], Future]] = {}
+    __cache_lock = threading.Lock()
+
+    # hashlib releases the GIL on large updates, so hashing threads run in
+    # parallel with each other and with the request path
+    __executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+    @classmethod
+    def execute(
+        cls,
+        file_path: str,
+        algorithm: str = "sha256",
+        read_size: int = 1024 * 1024,
+    ) -> str:
+        future, run = cls.__claim(
+            file_path=file_path, algorithm=algorithm, read_size=read_size
+        )
+
+        if run is not None:
+            run()
+
+        return future.result()
+
+    @classmethod
+    def submit(
+        cls,
+        file_path: str,
+        algorithm: str = "sha256",
+        read_size: int = 1024 * 1024,
+    ) -> Future:
+        try:
+            future, run = cls.__claim(
+                file_path=file_path, algorithm=algorithm, read_size=read_size
+            )
+
+        except OSError as e:
+            future, run = Future(), None
+            future.set_exception(e)
+
+        if run is not None:
+            cls.__executor.submit(run)
+
+        return future
+
+    @classmethod
+    def __claim(
+        cls, file_path: str, algorithm: str, read_size: int
+    ) -> Tuple[Future, Optional[Callable[[], None]]]:
+        # The future of the digest, and the hash to run when there is no
+        # cached or running one to share
+        stat = os.stat(file_path)
+        validator = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        key = (os.path.abspath(file_path), algorithm)
+
+        with cls.__cache_lock:
+            cached = cls.__cache.get(key)
+
+            if cached is not None and cached[0] == validator:
+                future = Future()
+                future.set_result(cached[1])
+                return future, None
+
+            pending = cls.__pending.get(key)
+
+            if pending is not None and pending[0] == validator:
+                return pending[1], None
+
+            future = Future()
+            cls.__pending[key] = (validator, future)
+
+        def run() -> None:
+            try:
+                checksum = cls.__hash(
+                    file_path=file_path, algorithm=algorithm, read_size=read_size
+                )
+
+            except BaseException as e:
+                cls.__forget_pending(key=key, future=future)
+                future.set_exception(e)
+                return
+
+            with cls.__cache_lock:
+                cls.__cache[key] = (validator, checksum)
+
+            cls.__forget_pending(key=key, future=future)
+            future.set_result(checksum)
+
+        return future, run
+
+    @classmethod
+    def __forget_pending(cls, key: Tuple[str, str], future: Future) -> None:
+        with cls.__cache_lock:
+            # A newer version of the file may have started its own hash
+            if cls.__pending.get(key, (None, None))[1] is future:
+                del cls.__pending[key]
+
     @classmethod
-    def execute(cls, file_path: str) -> str:
-        hash_function = getattr(hashlib, "sha256")()
+    def __hash(cls, file_path: str, algorithm: str, read_size: int) -> str:
+        hash_function = getattr(hashlib, algorithm)()
+        buffer = memoryview(bytearray(read_size))
 
-        with open(file_path, "rb") as file:
-            for chunk in iter(lambda: file.read(4096), b""):
-                hash_function.update(chunk)
+        with open(file_path, "rb", buffering=0) as file:
+            for read_bytes in iter(lambda: file.readinto(buffer), 0):
+                hash_function.update(buffer[:read_bytes])
 
         return hash_function.hexdigest()
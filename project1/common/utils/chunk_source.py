@@ -0,0 +1,24 @@
+from .file_cache import CachedFile
+
+
+class ChunkSource:
+    def __init__(self, cached_file: CachedFile, chunk_size: int) -> None:
+        self.__cached_file = cached_file
+        self.__chunk_size = chunk_size
+
+    @property
+    def chunk_size(self) -> int:
+        return self.__chunk_size
+
+    @property
+    def size(self) -> int:
+        return self.__cached_file.size
+
+    @property
+    def total_pkts(self) -> int:
+        return (self.size + self.__chunk_size - 1) // self.__chunk_size
+
+    def get_chunk(self, seq_number: int) -> bytes:
+        return self.__cached_file.read(
+            offset=seq_number * self.__chunk_size, length=self.__chunk_size
+        )
@@ -0,0 +1,88 @@
+from typing import Callable, List, Sequence, Tuple
+
+import select
+import socket
+
+
+class DrainingSocket:
+    def __init__(self, sock: socket.socket, max_datagrams: int = 128) -> None:
+        # The socket is kept non-blocking, waiting for the first datagram of
+        # a drain is done here with select
+        self.sock = sock
+        self.__max_datagrams = max_datagrams
+        self.__receive_buffer = None
+
+    def send_all(
+        self, datagrams: Sequence[Sequence[bytes]], address: Tuple[str, int]
+    ) -> int:
+        # Every datagram is a list of buffers, joined into one sendto. Header
+        # and payload are small enough that the copy is cheaper than
+        # sendmsg's scatter-gather setup, see benchmark_datagram_io.py.
+        # Stops at a full socket buffer and returns how many were sent
+        sendto = self.sock.sendto
+        join = b"".join
+        sent = 0
+
+        try:
+            for buffers in datagrams:
+                sendto(join(buffers), address)
+                sent += 1
+
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        return sent
+
+    def drain(
+        self, buffer_size: int, timeout: float = 0.0
+    ) -> List[Tuple[bytes, Tuple[str, int]]]:
+        # Waits up to timeout for the first datagram, then takes whatever
+        # else is already queued
+        self.__wait_readable(timeout=timeout)
+
+        return self.__receive_queued(receive=lambda _: self.sock.recvfrom(buffer_size))
+
+    def drain_views(
+        self, buffer_size: int, timeout: float = 0.0
+    ) -> List[Tuple[memoryview, Tuple[str, int]]]:
+        # Same as drain, but the datagrams are views of a receive buffer that
+        # the next call overwrites
+        self.__wait_readable(timeout=timeout)
+
+        if self.__receive_buffer is None or self.__receive_buffer[0] < buffer_size:
+            self.__receive_buffer = (
+                buffer_size,
+                memoryview(bytearray(buffer_size * self.__max_datagrams)),
+            )
+
+        slot_size, buffer = self.__receive_buffer
+
+        def receive(i: int) -> Tuple[memoryview, Tuple[str, int]]:
+            slot = buffer[i * slot_size : i * slot_size + buffer_size]
+            received, address = self.sock.recvfrom_into(slot)
+            return slot[:received], address
+
+        return self.__receive_queued(receive=receive)
+
+    def __wait_readable(self, timeout: float) -> None:
+        if timeout > 0.0:
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+
+            if not readable:
+                raise socket.timeout("timed out")
+
+    def __receive_queued(self, receive: Callable[[int], Tuple]) -> List[Tuple]:
+        datagrams = []
+
+        for _ in range(self.__max_datagrams):
+            try:
+                datagrams.append(receive(len(datagrams)))
+
+            except (BlockingIOError, InterruptedError):
+                break
+
+            except ConnectionResetError:
+                # ICMP port unreachable from a peer that went away
+                continue
+
+        return datagrams
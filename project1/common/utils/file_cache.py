@@ -0,0 +1,117 @@
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+import mmap
+import os
+import threading
+
+
+class CachedFile:
+    def __init__(self, key: Tuple[str, int, int], fd: int, size: int) -> None:
+        self.key = key
+        self.fd = fd
+        self.size = size
+        self.references = 0
+
+        # Merkle trees of the mapped content, by chunk size
+        self.merkle_trees: Dict[int, Any] = {}
+        self.merkle_tree_lock = threading.Lock()
+
+        # Empty files can't be mapped
+        self.buffer = mmap.mmap(fd, size, access=mmap.ACCESS_READ) if size else b""
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self.buffer[offset : offset + length]
+
+    def close(self) -> None:
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+        os.close(self.fd)
+
+
+class CachedFileHandle:
+    def __init__(self, file_cache: "FileCache", cached_file: CachedFile) -> None:
+        self.__file_cache = file_cache
+        self.__cached_file = cached_file
+
+    def __enter__(self) -> CachedFile:
+        return self.__cached_file
+
+    def __exit__(self, *_) -> None:
+        self.__file_cache.release(self.__cached_file)
+
+
+class FileCache:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.__max_bytes = max_bytes
+        self.__cached_bytes = 0
+        self.__lock = threading.Lock()
+
+        # Least recently used first
+        self.__entries: "OrderedDict[str, CachedFile]" = OrderedDict()
+
+    def open(self, file_path: str) -> CachedFileHandle:
+        return CachedFileHandle(file_cache=self, cached_file=self.acquire(file_path))
+
+    def acquire(self, file_path: str) -> CachedFile:
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        key = (file_path, stat.st_mtime_ns, stat.st_size)
+
+        with self.__lock:
+            cached_file = self.__entries.get(file_path)
+
+            if cached_file is not None and cached_file.key == key:
+                self.__entries.move_to_end(file_path)
+
+            else:
+                if cached_file is not None:
+                    # The file changed on disk, the old mapping lives on
+                    # until its last transfer releases it
+                    self.__forget(cached_file)
+
+                fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+
+                try:
+                    cached_file = CachedFile(key=key, fd=fd, size=os.fstat(fd).st_size)
+
+                except (OSError, ValueError):
+                    # Directories and special files can't be mapped
+                    os.close(fd)
+                    raise
+
+                self.__entries[file_path] = cached_file
+                self.__cached_bytes += cached_file.size
+
+            cached_file.references += 1
+            self.__evict()
+
+            return cached_file
+
+    def release(self, cached_file: CachedFile) -> None:
+        with self.__lock:
+            cached_file.references -= 1
+
+            if self.__entries.get(cached_file.key[0]) is not cached_file:
+                if cached_file.references == 0:
+                    cached_file.close()
+
+            else:
+                self.__evict()
+
+    def __forget(self, cached_file: CachedFile) -> None:
+        del self.__entries[cached_file.key[0]]
+        self.__cached_bytes -= cached_file.size
+
+        if cached_file.references == 0:
+            cached_file.close()
+
+    def __evict(self) -> None:
+        for cached_file in list(self.__entries.values()):
+            if self.__cached_bytes <= self.__max_bytes:
+                break
+
+            # Files in use are never unmapped
+            if cached_file.references == 0:
+                self.__forget(cached_file)
@@ -0,0 +1,83 @@
+from .file_cache import CachedFile
+from concurrent.futures import Future, ThreadPoolExecutor
+import hashlib
+import os
+
+
+class MerkleTree:
+    DIGEST_SIZE = 16
+
+    # Leaves and inner nodes are hashed with different prefixes so a chunk
+    # can never be passed off as a pair of digests
+    LEAF_PREFIX = b"\x00"
+    NODE_PREFIX = b"\x01"
+
+    # More workers than cores, so a small file isn't queued behind the tree
+    # of a large one
+    __executor = ThreadPoolExecutor(max_workers=max(4, os.cpu_count() or 1))
+
+    def __init__(self, leaves: bytes) -> None:
+        # Leaf digests back to back, DIGEST_SIZE bytes each, so the tree of a
+        # large file is one buffer instead of an object per chunk
+        self.leaves = leaves
+        self.root = self.__build_root(leaves=leaves)
+
+    def leaf(self, index: int) -> bytes:
+        return self.leaves[index * self.DIGEST_SIZE : (index + 1) * self.DIGEST_SIZE]
+
+    @classmethod
+    def hash_leaf(cls, chunk: bytes) -> bytes:
+        leaf_hash = hashlib.blake2b(cls.LEAF_PREFIX, digest_size=cls.DIGEST_SIZE)
+        leaf_hash.update(chunk)
+        return leaf_hash.digest()
+
+    @classmethod
+    def from_cached_file(cls, cached_file: CachedFile, chunk_size: int) -> "MerkleTree":
+        # Built once per mapping and chunk size, then shared by every transfer.
+        # The lock is the file's, so other files are set up meanwhile
+        with cached_file.merkle_tree_lock:
+            merkle_tree = cached_file.merkle_trees.get(chunk_size)
+
+            if merkle_tree is None:
+                leaves = bytearray()
+
+                for offset in range(0, cached_file.size, chunk_size):
+                    leaves += cls.hash_leaf(
+                        cached_file.read(offset=offset, length=chunk_size)
+                    )
+
+                merkle_tree = cls(leaves=bytes(leaves))
+                cached_file.merkle_trees[chunk_size] = merkle_tree
+
+        return merkle_tree
+
+    @classmethod
+    def submit(cls, cached_file: CachedFile, chunk_size: int) -> Future:
+        return cls.__executor.submit(cls.from_cached_file, cached_file, chunk_size)
+
+    def __build_root(self, leaves: bytes) -> bytes:
+        # Every level is flat like the leaves, a pair of nodes is the
+        # 2 * DIGEST_SIZE bytes at its offset
+        level = memoryview(leaves or self.hash_leaf(b""))
+        pair_size = 2 * self.DIGEST_SIZE
+
+        while len(level) > self.DIGEST_SIZE:
+            next_level = bytearray()
+
+            for offset in range(0, len(level), pair_size):
+                pair = level[offset : offset + pair_size]
+
+                if len(pair) == pair_size:
+                    node_hash = hashlib.blake2b(
+                        self.NODE_PREFIX, digest_size=self.DIGEST_SIZE
+                    )
+                    node_hash.update(pair)
+                    next_level += node_hash.digest()
+
+                else:
+                    # An odd node is promoted to the next level unchanged
+                    next_level += pair
+
+            level = memoryview(next_level)
+
+        return bytes(level)
@@ -0,0 +1,34 @@
+from typing import Optional
+
+import socket
+import sys
+
+# Linux values, the socket module doesn't expose all of them
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+
+IPV4_UDP_HEADERS_SIZE = 28
+
+
+class PathMtu:
+    @classmethod
+    def execute(cls, host: str, port: int) -> Optional[int]:
+        # Largest UDP payload that reaches the peer without fragmentation,
+        # None when the platform can't tell
+        if not sys.platform.startswith("linux"):
+            return None
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            try:
+                # With the don't-fragment bit set the kernel tracks the path
+                # MTU of the route, lowered by any ICMP fragmentation-needed
+                # it has seen for this peer
+                sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+                sock.connect((host, port))
+                mtu = sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+
+            except OSError:
+                return None
+
+        return mtu - IPV4_UDP_HEADERS_SIZE
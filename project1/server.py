@@ -1,164 +1,235 @@
-from common.model import ClientRequest
-from common.utils import CalculateChecksum
-from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, List, Tuple
+from common.model import (
+    Acknowledgement,
+    ClientRequest,
+    ETHERNET_DATAGRAM_SIZE,
+    MAX_DATAGRAM_SIZE,
+    Packet,
+)
+from common.protocol import TransferSession, TransferState
+from common.utils import (
+    CalculateChecksum,
+    ChunkSource,
+    DrainingSocket,
+    FileCache,
+    MerkleTree,
+)
+from typing import Dict, Optional, Set, Tuple
 
-import copy
 import json
 import os
 import random
+import selectors
 import socket
+import time
+
+MIN_CHUNK_SIZE = 64
+MIN_FEC_BLOCK_SIZE = 2
 
 
 class Server:
     def __init__(
-        self, host: str = "localhost", port: int = 8082, chunk_size: int = 256
+        self,
+        host: str = "localhost",
+        port: int = 8082,
+        chunk_size: int = Packet.max_chunk_size(ETHERNET_DATAGRAM_SIZE),
+        max_chunk_size: int = Packet.max_chunk_size(MAX_DATAGRAM_SIZE),
+        window_size: int = 256,
+        pacing_rate: Optional[float] = None,
+        file_cache_size: int = 256 * 1024 * 1024,
+        checksum_algorithm: str = "sha256",
+        max_datagrams_per_wakeup: int = 256,
+        enable_fec: bool = True,
     ) -> None:
         self.__base_path = "server_files/"
+        # Used when the client doesn't ask for a chunk size, requests are
+        # clamped to the range below
         self.__chunk_size = chunk_size
-        self.__temporary_file_buffer = {}
-        self.__client_retransmit_pkts_dict = {}
+        self.__max_chunk_size = max_chunk_size
+
+        # Whether clients may ask for a parity packet every few chunks
+        self.__enable_fec = enable_fec
+        self.__window_size = window_size
+        self.__checksum_algorithm = checksum_algorithm
+        self.__max_datagrams_per_wakeup = max_datagrams_per_wakeup
+
+        # Packets per second, None lets the congestion window set the pace
+        self.__pacing_rate = pacing_rate
+
+        # Read-only mappings shared by every transfer of the same file
+        self.__file_cache = FileCache(max_bytes=file_cache_size)
+
+        # Ongoing transfer of each client, all driven by the event loop
+        self.__sessions: Dict[Tuple[str, int], TransferSession] = {}
+
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.__sock.bind((host, port))
-        self.executor = ThreadPoolExecutor(max_workers=10)
+        self.__sock.setblocking(False)
+        self.__draining_sock = DrainingSocket(sock=self.__sock)
+
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.__sock, selectors.EVENT_READ)
 
     def execute(self) -> None:
         while True:
-            data, client_address = self.__sock.recvfrom(self.__chunk_size)
-            self.executor.submit(self.__handle_client, data, client_address)
+            if self.__selector.select(timeout=self.__next_timeout()):
+                self.__receive_datagrams()
 
-    def __handle_client(self, data: bytes, client_address: Tuple[str, int]) -> None:
-        keep_connection = True
-        while keep_connection:
-            data = data.decode("iso-8859-1")
-
-            print(f"Client {client_address} request: {data}")
-
-            if "Retransmit" in data:
-                pkt_number = json.loads(data)["Retransmit"]
-                self.__client_retransmit_pkts_dict.update(
-                    {client_address: {pkt_number: "OK"}}
-                )
-
-            elif "Finished retransmission" == data:
-                self.__retransmit_lost_pkts(client_address=client_address)
-                del self.__client_retransmit_pkts_dict[client_address]
+            self.__poll_sessions()
 
-            elif data == "Finish connection":
-                keep_connection = False
+    def __next_timeout(self) -> Optional[float]:
+        now = time.monotonic()
+        timeouts = [
+            timeout
+            for session in self.__sessions.values()
+            if (timeout := session.next_timeout(now=now)) is not None
+        ]
 
-            else:
-                data = json.loads(data)
-                transfer_object = ClientRequest(**data)
+        return min(timeouts) if timeouts else None
 
-                if self.__check_file_existency(transfer_object.file_name):
+    def __receive_datagrams(self) -> None:
+        received = 0
 
-                    self.__sock.sendto(
-                        json.dumps({"client_address": client_address[1]}).encode(
-                            "iso-8859-1"
-                        ),
-                        client_address,
-                    )
+        while received < self.__max_datagrams_per_wakeup:
+            datagrams = self.__draining_sock.drain(buffer_size=MAX_DATAGRAM_SIZE)
 
-                    chunks_dict = self.__get_file_chunks(
-                        file_path=transfer_object.file_name
-                    )
+            if not datagrams:
+                return
 
-                    self.__temporary_file_buffer.update(
-                        {client_address: copy.deepcopy(chunks_dict)}
-                    )
+            received += len(datagrams)
 
-                    self.__remove_chunks(
-                        chunks_dict=chunks_dict,
-                        discarded_pkts=transfer_object.discarded_pkts,
-                    )
+            for data, client_address in datagrams:
+                # Every client shares this loop, so a bad datagram only
+                # costs its sender an error reply
+                try:
+                    self.__dispatch(data=data, client_address=client_address)
 
-                    checksum = CalculateChecksum.execute(
-                        self.__base_path + transfer_object.file_name
-                    )
-
-                    self.__transfer_data(
-                        chunks_dict=chunks_dict,
-                        checksum=checksum,
+                except (ValueError, TypeError, OSError) as e:
+                    print(f"Client {client_address} sent an invalid request: {e}")
+                    self.__send(
+                        datagram="File does not exist".encode("iso-8859-1"),
                         client_address=client_address,
                     )
 
-                else:
-                    self.__sock.sendto(
-                        "File does not exist".encode("iso-8859-1"), client_address
-                    )
+    def __dispatch(self, data: bytes, client_address: Tuple[str, int]) -> None:
+        session = self.__sessions.get(client_address)
 
-    def __check_file_existency(self, file_path: str) -> bool:
-        if os.path.exists(self.__base_path + file_path):
-            return True
-        return False
+        if session is not None and Packet.is_packet(data):
+            session.on_ack(Acknowledgement.decode(data), now=time.monotonic())
 
-    def __get_file_chunks(self, file_path: str) -> Dict[str, bytes]:
-        chunks_dict = {}
-        i = 0
-        with open(self.__base_path + file_path, "rb") as file:
-            continue_reading = True
-            while continue_reading:
-                chunk = file.read(self.__chunk_size)
-                if not chunk:
-                    continue_reading = False
+        elif Packet.is_packet(data):
+            # Late acknowledgement of a transfer that already finished
+            return
 
-                else:
-                    chunks_dict.update({str(i): chunk})
-                    i += 1
+        else:
+            self.__handle_client(data=data, client_address=client_address)
 
-        chunks_dict.update({str(i): b"EOF"})
+    def __poll_sessions(self) -> None:
+        now = time.monotonic()
 
-        return chunks_dict
+        for client_address, session in list(self.__sessions.items()):
+            # Whatever doesn't fit in the socket buffer counts as lost, the
+            # retransmission timers take care of it
+            self.__draining_sock.send_all(
+                datagrams=session.poll(now=now), address=client_address
+            )
 
-    def __remove_chunks(self, chunks_dict: Dict[str, bytes], discarded_pkts: int):
-        if discarded_pkts >= len(chunks_dict):
-            chunks_dict.clear()
+            if session.done:
+                self.__close_session(client_address=client_address)
 
-        else:
-            for _ in range(discarded_pkts - 1):
-                key = random.choice(list(chunks_dict.keys()))
-                del chunks_dict[key]
+    def __send(self, datagram: bytes, client_address: Tuple[str, int]) -> None:
+        self.__draining_sock.send_all(datagrams=[[datagram]], address=client_address)
 
-    def __transfer_data(
-        self,
-        chunks_dict: Dict[str, bytes],
-        checksum: str,
-        client_address: Tuple[str, int],
-    ) -> None:
+    def __close_session(self, client_address: Tuple[str, int]) -> None:
+        session = self.__sessions.pop(client_address)
+        self.__file_cache.release(session.cached_file)
 
-        checksum_dict = json.dumps({"checksum": checksum})
-        self.__sock.sendto(checksum_dict.encode("iso-8859-1"), client_address)
+        if session.state == TransferState.FAILED:
+            print(f"Client {client_address} stopped acknowledging, transfer aborted")
 
-        for register in chunks_dict.items():
-            pkt_number = register[0]
-            chunk = register[1]
+    def __handle_client(self, data: bytes, client_address: Tuple[str, int]) -> None:
+        data = data.decode("iso-8859-1")
+
+        print(f"Client {client_address} request: {data}")
+
+        if client_address in self.__sessions:
+            # A new request or goodbye abandons the previous transfer
+            self.__close_session(client_address=client_address)
+
+        if data == "Finish connection":
+            return
+
+        data = json.loads(data)
+        transfer_object = ClientRequest(**data)
+
+        if self.__check_file_existency(transfer_object.file_name):
+            # Hash in the background while the transfer is being set up
+            checksum_future = CalculateChecksum.submit(
+                file_path=self.__base_path + transfer_object.file_name,
+                algorithm=self.__checksum_algorithm,
+            )
+
+            self.__send(
+                datagram=json.dumps({"client_address": client_address[1]}).encode(
+                    "iso-8859-1"
+                ),
+                client_address=client_address,
+            )
+
+            chunk_size = self.__negotiate_chunk_size(
+                requested_chunk_size=transfer_object.chunk_size
+            )
+            cached_file = self.__file_cache.acquire(
+                self.__base_path + transfer_object.file_name
+            )
+            chunk_source = ChunkSource(cached_file=cached_file, chunk_size=chunk_size)
+
+            self.__sessions[client_address] = TransferSession(
+                cached_file=cached_file,
+                chunk_size=chunk_size,
+                checksum_future=checksum_future,
+                merkle_tree_future=MerkleTree.submit(
+                    cached_file=cached_file, chunk_size=chunk_size
+                ),
+                checksum_algorithm=self.__checksum_algorithm,
+                discarded_pkts=self.__get_discarded_pkts(
+                    total_pkts=chunk_source.total_pkts,
+                    discarded_pkts=transfer_object.discarded_pkts,
+                ),
+                window_size=self.__window_size,
+                pacing_rate=self.__pacing_rate,
+                fec_block_size=self.__negotiate_fec_block_size(
+                    requested_fec_block_size=transfer_object.fec_block_size
+                ),
+            )
 
-            self.__sock.sendto(pkt_number.encode("iso-8859-1"), client_address)
-            self.__sock.sendto(chunk, client_address)
+        else:
+            self.__send(
+                datagram="File does not exist".encode("iso-8859-1"),
+                client_address=client_address,
+            )
 
-    def __retransmit_lost_pkts(self, client_address: Tuple[str, int]) -> None:
-        lost_pkts_list = self.__check_missing_pkts(client_address=client_address)
+    def __negotiate_chunk_size(self, requested_chunk_size: Optional[int]) -> int:
+        if requested_chunk_size is None:
+            return self.__chunk_size
 
-        for lost_pkt in lost_pkts_list:
-            chunk = self.__temporary_file_buffer.get(client_address).get(lost_pkt)
-            self.__sock.sendto(lost_pkt.encode("utf-8"), client_address)
-            self.__sock.sendto(chunk, client_address)
+        return max(MIN_CHUNK_SIZE, min(requested_chunk_size, self.__max_chunk_size))
 
-        self.__sock.sendto("Finished".encode("iso-8859-1"), client_address)
-        self.__sock.sendto("EOF".encode("iso-8859-1"), client_address)
+    def __negotiate_fec_block_size(
+        self, requested_fec_block_size: Optional[int]
+    ) -> Optional[int]:
+        if not self.__enable_fec or requested_fec_block_size is None:
+            return None
 
-    def __check_missing_pkts(self, client_address: Tuple[str, int]) -> List[str]:
-        lost_pkts_list = []
+        return max(MIN_FEC_BLOCK_SIZE, requested_fec_block_size)
 
-        for pkt_number in self.__temporary_file_buffer.get(client_address).keys():
-            if not (
-                self.__client_retransmit_pkts_dict.get(client_address).get(pkt_number)
-            ):
-                lost_pkts_list.append(pkt_number)
+    def __check_file_existency(self, file_path: str) -> bool:
+        if os.path.isfile(self.__base_path + file_path):
+            return True
+        return False
 
-        return lost_pkts_list
+    def __get_discarded_pkts(self, total_pkts: int, discarded_pkts: int) -> Set[int]:
+        return set(random.sample(range(total_pkts), min(discarded_pkts, total_pkts)))
 
 
 if __name__ == "__main__":
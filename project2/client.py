@@ -1,17 +1,45 @@
+from models.bulk_request import BulkRequest
 from models.file_data import FileData
+from models.file_listing import FileListing
+from models.file_request import FileRequest
+from models.frame import Frame, MessageType
+from models.range_request import RangeRequest
 from models.response import Response
+from models.resume_request import ResumeRequest
+from utils.body_reader import BodyReader
 from utils.calculate_checksum import CalculateChecksum
+from utils.compression import Compression
+from typing import BinaryIO, List, Optional, Sequence
 
 import json
 import os
 import socket
 import shutil
+import tarfile
+import threading
 
 
 class Client:
-    def __init__(self, server_ip: str = "localhost", server_port: int = 8082) -> None:
+    def __init__(
+        self,
+        server_ip: str = "localhost",
+        server_port: int = 8082,
+        streams: int = 1,
+        receive_buffer_size: int = 256 * 1024,
+        accept_encoding: Sequence[str] = Compression.ENCODINGS,
+    ) -> None:
+        self.__server_address = (server_ip, server_port)
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.__sock.connect((server_ip, server_port))
+        self.__sock.connect(self.__server_address)
+        self.__stream = self.__sock.makefile("rb")
+
+        # Files are fetched as this many disjoint ranges, each over its own
+        # connection
+        self.__streams = streams
+        self.__receive_buffer_size = receive_buffer_size
+
+        # Offered to the server, which compresses the files worth it
+        self.__accept_encoding = list(accept_encoding)
 
         self.__client_files_root_dir = "client_files/"
         self.__client_ip = self.__sock.getsockname()[0]
@@ -25,30 +53,311 @@ class Client:
             + "/"
         )
 
+        # Unfinished downloads, kept across sessions so they can be resumed
+        self.__partial_folder_path = (
+            self.__client_files_root_dir + self.__client_ip + "/partial/"
+        )
+
+    def __file_request_frame(self, file_path: str) -> bytes:
+        partial_file_path = self.__partial_folder_path + file_path
+
+        if os.path.isfile(partial_file_path) and os.path.getsize(partial_file_path):
+            return ResumeRequest(
+                file_path=file_path,
+                offset=os.path.getsize(partial_file_path),
+                prefix_checksum=CalculateChecksum.execute(file_path=partial_file_path),
+                accept_encoding=self.__accept_encoding,
+            ).encode()
+
+        return FileRequest(
+            file_path=file_path, accept_encoding=self.__accept_encoding
+        ).encode()
+
     def __client_file_request(self, file_path: str) -> None:
-        server_response = Response(**json.loads(self.__sock.recv(1024).decode("utf-8")))
+        frame = self.__read_frame(stream=self.__stream)
+        server_response = Response.decode(frame)
 
         if server_response.status == 403:
             print(server_response.message)
 
-        elif server_response.status == 200:
+        elif server_response.status in (200, 206):
             file_data = FileData(**json.loads(server_response.message))
 
             file_checksum = file_data.checksum
-            file_size = file_data.size
 
-            self.__save_file(file_path=file_path, file_size=file_size)
+            if file_data.offset:
+                print(f"Resuming from byte {file_data.offset}")
+
+            self.__save_file(
+                file_path=file_path,
+                offset=file_data.offset,
+                length=frame.body_length,
+                encoding=file_data.encoding,
+            )
 
             received_file_checksum = CalculateChecksum.execute(
-                file_path=self.__client_folder_path + file_path
+                file_path=self.__partial_folder_path + file_path,
+                algorithm=file_data.algorithm,
             )
 
             if file_checksum == received_file_checksum:
+                self.__create_client_folder(
+                    folder_path=os.path.dirname(self.__client_folder_path + file_path)
+                )
+                os.replace(
+                    self.__partial_folder_path + file_path,
+                    self.__client_folder_path + file_path,
+                )
                 print("File transmission successfully finished")
 
             else:
+                # A bad prefix would poison every later resume
+                os.remove(self.__partial_folder_path + file_path)
                 print("File transmission completed unsuccessfully")
 
+    def __join(self, directory: str, name: str) -> str:
+        return f"{directory}/{name}" if directory else name
+
+    def __client_list_request(self, directory: str) -> None:
+        self.__sock.sendall(
+            Frame(
+                message_type=MessageType.LIST_REQUEST, header=directory.encode("utf-8")
+            ).encode()
+        )
+        frame = self.__read_frame(stream=self.__stream)
+        server_response = Response.decode(frame)
+
+        if server_response.status != 200:
+            print(server_response.message)
+            return
+
+        listing = FileListing.decode(
+            BodyReader(stream=self.__stream, length=frame.body_length).read()
+        )
+
+        for file_entry in listing.files:
+            print(f"{file_entry.name}  {file_entry.size}  {file_entry.checksum}")
+
+        print(f"{len(listing.files)} files")
+
+    def __client_bulk_request(self, directory: str, format: str) -> None:
+        # A whole directory in one exchange, no round trip per file
+        self.__sock.sendall(
+            BulkRequest(
+                directory=directory,
+                format=format,
+                accept_encoding=self.__accept_encoding,
+            ).encode()
+        )
+        frame = self.__read_frame(stream=self.__stream)
+        server_response = Response.decode(frame)
+
+        if server_response.status != 200:
+            print(server_response.message)
+            return
+
+        if format == "tar":
+            self.__receive_tar(directory=directory.strip("/"), length=frame.body_length)
+            return
+
+        listing = FileListing.decode(
+            BodyReader(stream=self.__stream, length=frame.body_length).read()
+        )
+
+        for file_entry in listing.files:
+            self.__client_file_request(
+                file_path=self.__join(directory=listing.directory, name=file_entry.name)
+            )
+
+    def __receive_tar(self, directory: str, length: int) -> None:
+        body = BodyReader(stream=self.__stream, length=length)
+        received_files = 0
+        failed_files = 0
+
+        with tarfile.open(fileobj=body, mode="r|") as tar:
+            for member in tar:
+                name = os.path.normpath(member.name)
+
+                if (
+                    not member.isreg()
+                    or os.path.isabs(name)
+                    or name.split(os.sep)[0] == ".."
+                ):
+                    continue
+
+                file_path = self.__client_folder_path + self.__join(
+                    directory=directory, name=name
+                )
+                self.__create_client_folder(folder_path=os.path.dirname(file_path))
+
+                with tar.extractfile(member) as source, open(
+                    file=file_path, mode="wb"
+                ) as f:
+                    shutil.copyfileobj(source, f, self.__receive_buffer_size)
+
+                # The server puts each checksum in a pax header
+                algorithm, checksum = next(
+                    (
+                        (key.split(".", 1)[1], value)
+                        for key, value in member.pax_headers.items()
+                        if key.startswith("PROJECT2.")
+                    ),
+                    ("sha256", None),
+                )
+
+                if (
+                    CalculateChecksum.execute(file_path=file_path, algorithm=algorithm)
+                    == checksum
+                ):
+                    received_files += 1
+
+                else:
+                    os.remove(file_path)
+                    failed_files += 1
+
+        body.drain()
+
+        print(f"{received_files} files received, {failed_files} failed")
+
+    def __parallel_file_request(self, file_path: str) -> None:
+        # An empty range only brings the file size and checksum
+        self.__sock.sendall(
+            RangeRequest(file_path=file_path, offset=0, length=0).encode()
+        )
+        server_response = Response.decode(self.__read_frame(stream=self.__stream))
+
+        if server_response.status == 403:
+            print(server_response.message)
+            return
+
+        file_data = FileData(**json.loads(server_response.message))
+
+        self.__create_client_folder(folder_path=self.__client_folder_path)
+
+        with open(file=self.__client_folder_path + file_path, mode="wb") as f:
+            f.truncate(file_data.size)
+
+        range_size = -(-file_data.size // self.__streams)
+        errors: List[Exception] = []
+        threads = [
+            threading.Thread(
+                target=self.__fetch_range,
+                args=(
+                    file_path,
+                    offset,
+                    min(range_size, file_data.size - offset),
+                    errors,
+                ),
+            )
+            for offset in range(0, file_data.size, max(range_size, 1))
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            print(f"File transmission completed unsuccessfully: {errors[0]}")
+            return
+
+        received_file_checksum = CalculateChecksum.execute(
+            file_path=self.__client_folder_path + file_path,
+            algorithm=file_data.algorithm,
+        )
+
+        if file_data.checksum == received_file_checksum:
+            print("File transmission successfully finished")
+
+        else:
+            print("File transmission completed unsuccessfully")
+
+    def __fetch_range(
+        self, file_path: str, offset: int, length: int, errors: List[Exception]
+    ) -> None:
+        try:
+            with socket.create_connection(self.__server_address) as sock, sock.makefile(
+                "rb"
+            ) as stream, open(
+                file=self.__client_folder_path + file_path, mode="r+b"
+            ) as f:
+                sock.sendall(
+                    RangeRequest(
+                        file_path=file_path, offset=offset, length=length
+                    ).encode()
+                )
+                frame = self.__read_frame(stream=stream)
+                server_response = Response.decode(frame)
+
+                if server_response.status != 206:
+                    raise ValueError(server_response.message)
+
+                f.seek(offset)
+                self.__receive_body(stream=stream, f=f, length=frame.body_length)
+
+                sock.sendall(Frame(message_type=MessageType.EXIT).encode())
+
+        except (OSError, ValueError) as e:
+            errors.append(e)
+
+    def __read_frame(self, stream: BinaryIO) -> Frame:
+        frame = Frame.read(stream)
+
+        if frame is None:
+            raise ConnectionError("Connection closed by the server")
+
+        return frame
+
+    def __receive_body(
+        self, stream: BinaryIO, f: BinaryIO, length: int, decompressor=None
+    ) -> None:
+        buffer = memoryview(bytearray(self.__receive_buffer_size))
+        received = 0
+
+        while received < length:
+            read_bytes = stream.readinto(buffer[: min(len(buffer), length - received)])
+
+            if not read_bytes:
+                raise ConnectionError("Connection closed mid body")
+
+            if decompressor is None:
+                f.write(buffer[:read_bytes])
+
+            else:
+                f.write(decompressor.decompress(buffer[:read_bytes]))
+
+            received += read_bytes
+
+    def __receive_compressed_body(
+        self, stream: BinaryIO, f: BinaryIO, encoding: str
+    ) -> None:
+        # Decompressed as it arrives, so the partial file always holds a
+        # plain prefix that can be resumed from
+        decompressor = Compression.decompressor(encoding=encoding)
+
+        while True:
+            frame = self.__read_frame(stream=stream)
+
+            if frame.message_type != MessageType.FILE_CHUNK:
+                raise ConnectionError("Unexpected frame mid body")
+
+            if not frame.body_length:
+                break
+
+            self.__receive_body(
+                stream=stream,
+                f=f,
+                length=frame.body_length,
+                decompressor=decompressor,
+            )
+
+        if not decompressor.eof:
+            raise ConnectionError("Compressed body cut short")
+
+        compressed_size = json.loads(frame.header.decode("utf-8"))["compressed_size"]
+        print(f"Received {compressed_size} bytes compressed with {encoding}")
+
     def __create_client_folder(self, folder_path: str) -> None:
         if not os.path.exists(folder_path):
             os.makedirs(folder_path)
@@ -57,56 +366,112 @@ class Client:
         if os.path.exists(self.__client_folder_path):
             shutil.rmtree(self.__client_folder_path)
 
-    def __save_file(self, file_path: str, file_size: int) -> None:
-        self.__create_client_folder(folder_path=self.__client_folder_path)
+    def __save_file(
+        self,
+        file_path: str,
+        offset: int,
+        length: int,
+        encoding: Optional[str] = None,
+    ) -> None:
+        self.__create_client_folder(
+            folder_path=os.path.dirname(self.__partial_folder_path + file_path)
+        )
 
-        received_chunks = 0
+        # Received bytes go to the partial file first, if the connection
+        # drops it stays there for the next request to resume from
+        with open(
+            file=self.__partial_folder_path + file_path,
+            mode="r+b" if offset else "wb",
+        ) as f:
+            f.truncate(offset)
+            f.seek(offset)
 
-        with open(file=self.__client_folder_path + file_path, mode="wb") as f:
-            while received_chunks < file_size:
-                chunk = self.__sock.recv(1024)
-                f.write(chunk)
+            if encoding:
+                self.__receive_compressed_body(
+                    stream=self.__stream, f=f, encoding=encoding
+                )
 
-                received_chunks += len(chunk)
+            else:
+                self.__receive_body(stream=self.__stream, f=f, length=length)
 
     def __client_chat(self) -> None:
+        # Keystrokes come in batches, already turned into text
         while True:
-            key = self.__sock.recv(1024).decode("utf-8")
+            frame = self.__read_frame(stream=self.__stream)
 
-            if key == "esc":
-                print()
+            if frame.message_type == MessageType.RESPONSE:
+                print(Response.decode(frame).message)
                 break
 
-            print(self.__key_handler(key=key), end="", flush=True)
-
-    def __key_handler(self, key: str) -> str:
-        if key == "space":
-            return " "
+            if frame.message_type == MessageType.CHAT_END:
+                print()
+                break
 
-        elif key == "enter":
-            return "\n"
-
-        else:
-            return key
+            print(frame.header.decode("utf-8"), end="", flush=True)
 
     def execute(self) -> None:
         while True:
 
             client_message = input("Request: ")
 
-            self.__sock.sendall(client_message.encode("utf-8"))
-
             if client_message.lower() == "exit":
+                self.__sock.sendall(Frame(message_type=MessageType.EXIT).encode())
                 break
 
-            if client_message.lower() == "chat":
+            # "chat" joins the default room, "chat <room>" any other
+            if client_message.lower().split(" ")[0] == "chat":
+                self.__sock.sendall(
+                    Frame(
+                        message_type=MessageType.CHAT,
+                        header=client_message[len("chat") :].strip().encode("utf-8"),
+                    ).encode()
+                )
                 self.__client_chat()
+                continue
+
+            # "list [dir]" shows a directory, "fetch [dir] [tar]" brings all
+            # of it back
+            command, _, argument = client_message.partition(" ")
+
+            if command.lower() == "list":
+                self.__client_list_request(directory=argument.strip())
+                continue
+
+            if command.lower() == "fetch":
+                directory, _, format = argument.strip().partition(" ")
+                self.__client_bulk_request(
+                    directory=directory, format=format.strip() or "stream"
+                )
+                continue
+
+            # Several files can be asked for at once, separated by spaces
+            file_paths = client_message.split()
+
+            if self.__streams > 1:
+                for file_path in file_paths:
+                    self.__parallel_file_request(file_path=file_path)
 
             else:
-                self.__client_file_request(file_path=client_message)
+                # Pipelined: every request goes out before the first
+                # response is read, responses come back in the same order
+                self.__sock.sendall(
+                    b"".join(
+                        self.__file_request_frame(file_path=file_path)
+                        for file_path in file_paths
+                    )
+                )
+
+                try:
+                    for file_path in file_paths:
+                        self.__client_file_request(file_path=file_path)
+
+                except ConnectionError as e:
+                    print(f"{e}, partial downloads are kept to be resumed")
+                    break
 
         self.__remove_client_folder()
 
+        self.__stream.close()
         self.__sock.close()
 
 
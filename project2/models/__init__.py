@@ -1,2 +1,8 @@
 from .response import Response
+from .bulk_request import BulkRequest
 from .file_data import FileData
+from .file_listing import FileEntry, FileListing
+from .file_request import FileRequest
+from .frame import Frame, MessageType
+from .range_request import RangeRequest
+from .resume_request import ResumeRequest
@@ -0,0 +1,25 @@
+from .frame import Frame, MessageType
+from dataclasses import asdict, dataclass, field
+from typing import List
+
+import json
+
+
+@dataclass
+class BulkRequest:
+    directory: str
+
+    # "stream" sends the listing and then every file as its own response,
+    # "tar" a single uncompressed tar stream
+    format: str = "stream"
+    accept_encoding: List[str] = field(default_factory=list)
+
+    def encode(self) -> bytes:
+        return Frame(
+            message_type=MessageType.BULK_REQUEST,
+            header=json.dumps(asdict(self)).encode("utf-8"),
+        ).encode()
+
+    @classmethod
+    def decode(cls, frame: Frame) -> "BulkRequest":
+        return cls(**json.loads(frame.header.decode("utf-8")))
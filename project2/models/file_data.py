@@ -1,4 +1,5 @@
 from dataclasses import asdict, dataclass
+from typing import Optional
 
 import json
 
@@ -7,6 +8,14 @@ import json
 class FileData:
     checksum: str
     size: int
+    algorithm: str = "sha256"
+
+    # Part of the file that follows, only set for range requests
+    offset: int = 0
+    length: Optional[int] = None
+
+    # Set when the body is compressed, it then comes as FILE_CHUNK frames
+    encoding: Optional[str] = None
 
     def encode(self) -> bytes:
         return json.dumps(asdict(self), indent=4).encode("utf-8")
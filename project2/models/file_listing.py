@@ -0,0 +1,30 @@
+from dataclasses import asdict, dataclass, field
+from typing import List
+
+import json
+
+
+@dataclass
+class FileEntry:
+    # Path relative to the listed directory, always with "/" separators
+    name: str
+    size: int
+    checksum: str
+
+
+@dataclass
+class FileListing:
+    directory: str
+    algorithm: str = "sha256"
+    files: List[FileEntry] = field(default_factory=list)
+
+    def encode(self) -> bytes:
+        # Sent as a frame body, thousands of entries don't fit in a header
+        return json.dumps(asdict(self)).encode("utf-8")
+
+    @classmethod
+    def decode(cls, body: bytes) -> "FileListing":
+        listing = json.loads(body.decode("utf-8"))
+        listing["files"] = [FileEntry(**entry) for entry in listing["files"]]
+
+        return cls(**listing)
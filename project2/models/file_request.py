@@ -0,0 +1,23 @@
+from .frame import Frame, MessageType
+from dataclasses import asdict, dataclass, field
+from typing import List
+
+import json
+
+
+@dataclass
+class FileRequest:
+    file_path: str
+
+    # Encodings the client can decompress, empty for raw bytes only
+    accept_encoding: List[str] = field(default_factory=list)
+
+    def encode(self) -> bytes:
+        return Frame(
+            message_type=MessageType.FILE_REQUEST,
+            header=json.dumps(asdict(self)).encode("utf-8"),
+        ).encode()
+
+    @classmethod
+    def decode(cls, frame: Frame) -> "FileRequest":
+        return cls(**json.loads(frame.header.decode("utf-8")))
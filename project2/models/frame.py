@@ -0,0 +1,97 @@
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import BinaryIO, Optional
+
+import asyncio
+import struct
+
+
+class MessageType(IntEnum):
+    # Client to server
+    FILE_REQUEST = 1
+    RANGE_REQUEST = 2
+    CHAT = 3
+    EXIT = 4
+    RESUME_REQUEST = 8
+    LIST_REQUEST = 10
+    BULK_REQUEST = 11
+
+    # Server to client
+    RESPONSE = 5
+    CHAT_KEY = 6
+    CHAT_END = 7
+    FILE_CHUNK = 9
+
+
+# Message type, header length and body length. The header is read whole,
+# the body follows as raw bytes so file contents can be streamed
+FRAME_HEADER = struct.Struct("!BIQ")
+
+# Headers are small JSON documents, anything bigger is a broken peer
+MAX_HEADER_SIZE = 64 * 1024
+
+
+@dataclass
+class Frame:
+    message_type: MessageType
+    header: bytes = b""
+    body_length: int = 0
+
+    def encode(self) -> bytes:
+        return (
+            FRAME_HEADER.pack(self.message_type, len(self.header), self.body_length)
+            + self.header
+        )
+
+    @classmethod
+    def read(cls, stream: BinaryIO) -> Optional["Frame"]:
+        # None when the peer closed the connection between frames
+        prefix = stream.read(FRAME_HEADER.size)
+
+        if not prefix:
+            return None
+
+        if len(prefix) < FRAME_HEADER.size:
+            raise ConnectionError("Connection closed mid frame")
+
+        message_type, header_length, body_length = FRAME_HEADER.unpack(prefix)
+        if header_length > MAX_HEADER_SIZE:
+            raise ValueError("Frame header too large")
+
+        header = stream.read(header_length)
+
+        if len(header) < header_length:
+            raise ConnectionError("Connection closed mid frame")
+
+        return cls(
+            message_type=MessageType(message_type),
+            header=header,
+            body_length=body_length,
+        )
+
+    @classmethod
+    async def read_async(cls, reader: asyncio.StreamReader) -> Optional["Frame"]:
+        try:
+            prefix = await reader.readexactly(FRAME_HEADER.size)
+
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+
+            raise ConnectionError("Connection closed mid frame") from e
+
+        message_type, header_length, body_length = FRAME_HEADER.unpack(prefix)
+        if header_length > MAX_HEADER_SIZE:
+            raise ValueError("Frame header too large")
+
+        try:
+            header = await reader.readexactly(header_length)
+
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionError("Connection closed mid frame") from e
+
+        return cls(
+            message_type=MessageType(message_type),
+            header=header,
+            body_length=body_length,
+        )
@@ -0,0 +1,21 @@
+from .frame import Frame, MessageType
+from dataclasses import asdict, dataclass
+
+import json
+
+
+@dataclass
+class RangeRequest:
+    file_path: str
+    offset: int
+    length: int
+
+    def encode(self) -> bytes:
+        return Frame(
+            message_type=MessageType.RANGE_REQUEST,
+            header=json.dumps(asdict(self)).encode("utf-8"),
+        ).encode()
+
+    @classmethod
+    def decode(cls, frame: Frame) -> "RangeRequest":
+        return cls(**json.loads(frame.header.decode("utf-8")))
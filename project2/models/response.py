@@ -1,3 +1,4 @@
+from .frame import Frame, MessageType
 from dataclasses import asdict, dataclass
 
 import json
@@ -8,5 +9,14 @@ class Response:
     status: int
     message: str
 
-    def encode(self) -> bytes:
-        return json.dumps(asdict(self), indent=4).encode("utf-8")
+    def encode(self, body_length: int = 0) -> bytes:
+        # The body, if any, is sent right after as raw bytes
+        return Frame(
+            message_type=MessageType.RESPONSE,
+            header=json.dumps(asdict(self), indent=4).encode("utf-8"),
+            body_length=body_length,
+        ).encode()
+
+    @classmethod
+    def decode(cls, frame: Frame) -> "Response":
+        return cls(**json.loads(frame.header.decode("utf-8")))
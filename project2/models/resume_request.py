@@ -0,0 +1,26 @@
+from .frame import Frame, MessageType
+from dataclasses import asdict, dataclass, field
+from typing import List
+
+import json
+
+
+@dataclass
+class ResumeRequest:
+    # Bytes the client already holds and their checksum, the server only
+    # sends the rest when its own prefix matches
+    file_path: str
+    offset: int
+    prefix_checksum: str
+    algorithm: str = "sha256"
+    accept_encoding: List[str] = field(default_factory=list)
+
+    def encode(self) -> bytes:
+        return Frame(
+            message_type=MessageType.RESUME_REQUEST,
+            header=json.dumps(asdict(self)).encode("utf-8"),
+        ).encode()
+
+    @classmethod
+    def decode(cls, frame: Frame) -> "ResumeRequest":
+        return cls(**json.loads(frame.header.decode("utf-8")))
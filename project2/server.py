@@ -1,136 +1,654 @@
+from models.bulk_request import BulkRequest
 from models.file_data import FileData
+from models.file_listing import FileEntry, FileListing
+from models.file_request import FileRequest
+from models.frame import Frame, MessageType
+from models.range_request import RangeRequest
+from models.resume_request import ResumeRequest
 from models.response import Response
 from utils.calculate_checksum import CalculateChecksum
-
-import keyboard
+from utils.chat_broker import ChatBroker
+from utils.chat_sources import KeyboardSource, StdinSource
+from utils.compression import Compression
+from utils.file_cache import CachedFile, FileCache
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import asyncio
+import json
 import os
-import socket
+import tarfile
 import threading
 
 
 class Server:
-    def __init__(self, ip: str = "localhost", port: int = 8082) -> None:
-        self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.__sock.bind((ip, port))
+    def __init__(
+        self,
+        ip: str = "localhost",
+        port: int = 8082,
+        file_cache_size: int = 256 * 1024 * 1024,
+        checksum_algorithm: str = "sha256",
+        backlog: int = 1024,
+        max_connections: int = 10000,
+        idle_timeout: float = 300.0,
+        write_buffer_size: int = 1024 * 1024,
+        chat_sources: Optional[Dict[str, Iterable[str]]] = None,
+        chat_room: str = "lobby",
+        chat_flush_interval: float = 0.05,
+        compression_encodings: Sequence[str] = Compression.ENCODINGS,
+        compression_max_ratio: float = 0.9,
+    ) -> None:
+        self.__ip = ip
+        self.__port = port
+
+        # Pending connections the kernel queues while we are busy
+        self.__backlog = backlog
+
+        # Connections over the limit get a busy response and are closed
+        self.__max_connections = max_connections
+        self.__connections = 0
+
+        # Connections that send nothing for this long are closed
+        self.__idle_timeout = idle_timeout
 
-        # Maximum number of connections
-        self.__sock.listen(5)
+        # Writes wait for the peer once this much is buffered
+        self.__write_buffer_size = write_buffer_size
 
         self.__server_files_root_dir = "server_files/"
 
+        # Read-only mappings shared by every connection sending the same file
+        self.__file_cache = FileCache(max_bytes=file_cache_size)
+
+        self.__checksum_algorithm = checksum_algorithm
+
+        # Files are compressed when the client accepts one of these and a
+        # sample shrinks below compression_max_ratio of its size
+        self.__compression_encodings = compression_encodings
+        self.__compression_max_ratio = compression_max_ratio
+
+        # Each source publishes to its own room, clients subscribe to one
+        # and get its keystrokes in batches. Without sources, chat_room
+        # (the room of a bare "chat") gets the keyboard, or stdin
+        self.__chat_sources = (
+            {chat_room: self.__get_default_chat_source()}
+            if chat_sources is None
+            else dict(chat_sources)
+        )
+        self.__chat_room = chat_room
+
+        # Rooms whose source is exhausted, kept until the next client gets
+        # the text nobody received yet
+        self.__ended_chat_rooms: Set[str] = set()
+        self.__chat_broker = ChatBroker(
+            flush_interval=chat_flush_interval,
+            max_buffered_bytes=write_buffer_size,
+        )
+
     def __check_file_existency(self, file_path: str) -> bool:
-        if os.path.exists(self.__server_files_root_dir + file_path):
+        if os.path.isfile(self.__server_files_root_dir + file_path):
             return True
 
         return False
 
-    def __send_file(self, file_path: str, client_socket: socket.socket) -> None:
-        with open(file=self.__server_files_root_dir + file_path, mode="rb") as f:
-            while chunk := f.read(1024):
-                client_socket.sendall(chunk)
+    def __list_directory(self, directory: str) -> Optional[List[str]]:
+        # Every file below the directory, None when it isn't one of ours
+        root_dir = os.path.realpath(self.__server_files_root_dir)
+        directory_path = os.path.realpath(os.path.join(root_dir, directory))
+
+        if os.path.commonpath(
+            [root_dir, directory_path]
+        ) != root_dir or not os.path.isdir(directory_path):
+            return None
+
+        names = []
+
+        for dir_path, dir_names, file_names in os.walk(directory_path):
+            dir_names.sort()
+            relative_dir = os.path.relpath(dir_path, directory_path)
 
-    def __client_file_request(
-        self, file_path: str, client_socket: socket.socket
+            for file_name in sorted(file_names):
+                name = os.path.normpath(os.path.join(relative_dir, file_name))
+                names.append(name.replace(os.sep, "/"))
+
+        return names
+
+    def __join(self, directory: str, name: str) -> str:
+        return f"{directory}/{name}" if directory else name
+
+    async def __file_listing(self, directory: str, names: List[str]) -> FileListing:
+        # Hashed in parallel, and mostly served from the checksum cache
+        # when a directory is synced again
+        file_paths = [
+            self.__server_files_root_dir + self.__join(directory=directory, name=name)
+            for name in names
+        ]
+        checksums = await asyncio.gather(
+            *(
+                asyncio.wrap_future(
+                    CalculateChecksum.submit(
+                        file_path=file_path, algorithm=self.__checksum_algorithm
+                    )
+                )
+                for file_path in file_paths
+            )
+        )
+
+        return FileListing(
+            directory=directory,
+            algorithm=self.__checksum_algorithm,
+            files=[
+                FileEntry(name=name, size=os.path.getsize(file_path), checksum=checksum)
+                for name, file_path, checksum in zip(names, file_paths, checksums)
+            ],
+        )
+
+    async def __send_file(
+        self,
+        cached_file: CachedFile,
+        writer: asyncio.StreamWriter,
+        offset: int,
+        length: int,
     ) -> None:
-        if self.__check_file_existency(file_path=file_path):
-            file_checksum = CalculateChecksum.execute(
-                file_path=self.__server_files_root_dir + file_path
+        if not length:
+            return
+
+        await writer.drain()
+
+        # The descriptor is duplicated so the cached one is never closed,
+        # sendfile works with explicit offsets so sharing its position is
+        # harmless
+        with os.fdopen(os.dup(cached_file.fd), "rb") as f:
+            try:
+                await asyncio.get_running_loop().sendfile(
+                    writer.transport, f, offset=offset, count=length, fallback=False
+                )
+                return
+
+            except asyncio.SendfileNotAvailableError:
+                pass
+
+        # Copied from the shared mapping, waiting for the peer between
+        # chunks so a slow reader never buffers the whole file
+        for chunk_offset in range(offset, offset + length, self.__write_buffer_size):
+            writer.write(
+                cached_file.read(
+                    offset=chunk_offset,
+                    length=min(
+                        self.__write_buffer_size, offset + length - chunk_offset
+                    ),
+                )
+            )
+            await writer.drain()
+
+    def __write_file_chunk(self, writer: asyncio.StreamWriter, chunk: bytes) -> int:
+        # An empty chunk ends the body, so compressors that hold their
+        # output back send nothing
+        if chunk:
+            writer.write(
+                Frame(
+                    message_type=MessageType.FILE_CHUNK, body_length=len(chunk)
+                ).encode()
             )
+            writer.write(chunk)
 
-            file_size = os.path.getsize(
-                filename=self.__server_files_root_dir + file_path
+        return len(chunk)
+
+    async def __send_compressed_file(
+        self,
+        cached_file: CachedFile,
+        writer: asyncio.StreamWriter,
+        offset: int,
+        length: int,
+        encoding: str,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        compressor = Compression.compressor(encoding=encoding)
+        compressed_size = 0
+
+        # The compressed size is only known once it is all out, so the body
+        # goes in chunks and a last empty one carries the total. zlib and
+        # lzma release the GIL, so compressing doesn't stall other clients
+        for chunk_offset in range(offset, offset + length, self.__write_buffer_size):
+            chunk = await loop.run_in_executor(
+                None,
+                compressor.compress,
+                cached_file.read(
+                    offset=chunk_offset,
+                    length=min(
+                        self.__write_buffer_size, offset + length - chunk_offset
+                    ),
+                ),
             )
 
-            client_socket.sendall(
-                Response(
-                    status=200,
-                    message=FileData(
-                        checksum=file_checksum, size=file_size
-                    ).serialize(),
-                ).encode()
+            compressed_size += self.__write_file_chunk(writer=writer, chunk=chunk)
+            await writer.drain()
+
+        compressed_size += self.__write_file_chunk(
+            writer=writer, chunk=compressor.flush()
+        )
+
+        writer.write(
+            Frame(
+                message_type=MessageType.FILE_CHUNK,
+                header=json.dumps({"compressed_size": compressed_size}).encode("utf-8"),
+            ).encode()
+        )
+
+    async def __client_file_request(
+        self,
+        file_path: str,
+        writer: asyncio.StreamWriter,
+        offset: int = 0,
+        length: Optional[int] = None,
+        accept_encoding: Sequence[str] = (),
+    ) -> None:
+        if self.__check_file_existency(file_path=file_path):
+            # Hash in the background while the file is being mapped
+            checksum_future = CalculateChecksum.submit(
+                file_path=self.__server_files_root_dir + file_path,
+                algorithm=self.__checksum_algorithm,
             )
 
-            self.__send_file(file_path=file_path, client_socket=client_socket)
+            with self.__file_cache.open(
+                self.__server_files_root_dir + file_path
+            ) as cached_file:
+                if length is None:
+                    status = 200
+                    offset, length = 0, cached_file.size
+
+                else:
+                    # Ranges past the end of the file are cut short
+                    status = 206
+                    offset = min(max(offset, 0), cached_file.size)
+                    length = min(max(length, 0), cached_file.size - offset)
+
+                # Decided per file from its extension and a sample of the
+                # part being sent
+                encoding = Compression.choose(
+                    file_path=file_path,
+                    size=length,
+                    sample=cached_file.read(offset=offset + length // 2, length=32768)
+                    + cached_file.read(offset=offset, length=32768),
+                    accepted=accept_encoding,
+                    encodings=self.__compression_encodings,
+                    max_ratio=self.__compression_max_ratio,
+                )
+
+                writer.write(
+                    Response(
+                        status=status,
+                        message=FileData(
+                            checksum=await asyncio.wrap_future(checksum_future),
+                            size=cached_file.size,
+                            algorithm=self.__checksum_algorithm,
+                            offset=offset,
+                            length=length if status == 206 else None,
+                            encoding=encoding,
+                        ).serialize(),
+                    ).encode(body_length=0 if encoding else length)
+                )
+
+                if encoding:
+                    await self.__send_compressed_file(
+                        cached_file=cached_file,
+                        writer=writer,
+                        offset=offset,
+                        length=length,
+                        encoding=encoding,
+                    )
+
+                else:
+                    await self.__send_file(
+                        cached_file=cached_file,
+                        writer=writer,
+                        offset=offset,
+                        length=length,
+                    )
 
         else:
-            client_socket.sendall(
-                Response(status=403, message="File not found").encode()
-            )
+            writer.write(Response(status=403, message="File not found").encode())
 
-    def __client_chat(self, client_socket: socket.socket) -> None:
-        while True:
-            event = keyboard.read_event()
-
-            if event.name == "esc":
-                client_socket.sendall("esc".encode("utf-8"))
-                break
-
-            if event.event_type == "down":
-                key = self.__key_handler(event.name)
-
-                if key:
-                    print(key, end="", flush=True)
-
-                    client_socket.sendall(key.encode("utf-8"))
-
-    def __key_handler(self, key: str) -> str:
-        control_keys = [
-            "right shift",
-            "left shift",
-            "right ctrl",
-            "left ctrl",
-            "backspace",
-            "delete",
-            "alt gr",
-            "esc",
-            "alt",
-            "tab",
-            "up",
-            "right",
-            "down",
-            "left",
-            "backspace",
-        ]
+        await writer.drain()
 
-        if key == "space":
-            return " "
+    async def __client_resume_request(
+        self, resume_request: ResumeRequest, writer: asyncio.StreamWriter
+    ) -> None:
+        file_path = self.__server_files_root_dir + resume_request.file_path
 
-        elif key == "enter":
-            return "\n"
+        if not self.__check_file_existency(file_path=resume_request.file_path):
+            await self.__client_file_request(
+                file_path=resume_request.file_path,
+                writer=writer,
+                accept_encoding=resume_request.accept_encoding,
+            )
+            return
+
+        file_size = os.path.getsize(file_path)
+
+        # The client's prefix must be what we would have sent, otherwise
+        # the whole file goes out again
+        if (
+            0 < resume_request.offset <= file_size
+            and resume_request.algorithm in CalculateChecksum.ALGORITHMS
+            and await asyncio.wrap_future(
+                CalculateChecksum.submit(
+                    file_path=file_path,
+                    algorithm=resume_request.algorithm,
+                    length=resume_request.offset,
+                )
+            )
+            == resume_request.prefix_checksum
+        ):
+            await self.__client_file_request(
+                file_path=resume_request.file_path,
+                writer=writer,
+                offset=resume_request.offset,
+                length=file_size - resume_request.offset,
+                accept_encoding=resume_request.accept_encoding,
+            )
 
-        elif key in control_keys:
-            return ""
+        else:
+            await self.__client_file_request(
+                file_path=resume_request.file_path,
+                writer=writer,
+                accept_encoding=resume_request.accept_encoding,
+            )
+
+    async def __client_list_request(
+        self, directory: str, writer: asyncio.StreamWriter
+    ) -> None:
+        directory = directory.strip("/")
+        names = self.__list_directory(directory=directory)
+
+        if names is None:
+            writer.write(Response(status=403, message="Directory not found").encode())
 
         else:
-            return key
+            listing = (
+                await self.__file_listing(directory=directory, names=names)
+            ).encode()
 
-    def __handle_client(self, client_socket: socket.socket) -> None:
-        while True:
-            message = client_socket.recv(1024).decode("utf-8")
+            writer.write(
+                Response(status=200, message="Directory listing").encode(
+                    body_length=len(listing)
+                )
+            )
+            writer.write(listing)
 
-            if message.lower() == "exit":
-                break
+        await writer.drain()
 
-            if message.lower() == "chat":
-                self.__client_chat(client_socket=client_socket)
+    async def __client_bulk_request(
+        self, bulk_request: BulkRequest, writer: asyncio.StreamWriter
+    ) -> None:
+        directory = bulk_request.directory.strip("/")
+        names = self.__list_directory(directory=directory)
+
+        if bulk_request.format not in ("stream", "tar"):
+            writer.write(Response(status=400, message="Unknown format").encode())
+            await writer.drain()
+            return
+
+        if names is None:
+            writer.write(Response(status=403, message="Directory not found").encode())
+            await writer.drain()
+            return
+
+        listing = await self.__file_listing(directory=directory, names=names)
+
+        if bulk_request.format == "tar":
+            await self.__send_tar(listing=listing, writer=writer)
+            return
+
+        # The listing goes first, then every file as if it had been
+        # requested on its own, all without waiting for the client
+        body = listing.encode()
+        writer.write(
+            Response(status=200, message="Bulk transfer").encode(body_length=len(body))
+        )
+        writer.write(body)
+
+        for file_entry in listing.files:
+            await self.__client_file_request(
+                file_path=self.__join(directory=directory, name=file_entry.name),
+                writer=writer,
+                accept_encoding=bulk_request.accept_encoding,
+            )
 
-            else:
-                self.__client_file_request(
-                    file_path=message, client_socket=client_socket
+    async def __send_tar(
+        self, listing: FileListing, writer: asyncio.StreamWriter
+    ) -> None:
+        # Headers are built up front so the body length is known, each
+        # checksum travels in a pax header of its file
+        headers = []
+
+        for file_entry in listing.files:
+            tar_info = tarfile.TarInfo(name=file_entry.name)
+            tar_info.size = file_entry.size
+            tar_info.mode = 0o644
+            tar_info.mtime = int(
+                os.path.getmtime(
+                    self.__server_files_root_dir
+                    + self.__join(directory=listing.directory, name=file_entry.name)
+                )
+            )
+            tar_info.pax_headers = {
+                f"PROJECT2.{listing.algorithm}": file_entry.checksum
+            }
+            headers.append(tar_info.tobuf(format=tarfile.PAX_FORMAT))
+
+        body_length = 2 * tarfile.BLOCKSIZE + sum(
+            len(header) + -(-file_entry.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            for header, file_entry in zip(headers, listing.files)
+        )
+
+        writer.write(
+            Response(status=200, message="Tar transfer").encode(body_length=body_length)
+        )
+
+        for header, file_entry in zip(headers, listing.files):
+            writer.write(header)
+
+            with self.__file_cache.open(
+                self.__server_files_root_dir
+                + self.__join(directory=listing.directory, name=file_entry.name)
+            ) as cached_file:
+                # The length is already promised, a file that changed since
+                # can only end the connection
+                if cached_file.size != file_entry.size:
+                    raise ConnectionError("File changed while being sent")
+
+                await self.__send_file(
+                    cached_file=cached_file,
+                    writer=writer,
+                    offset=0,
+                    length=cached_file.size,
                 )
 
-        client_socket.close()
+            writer.write(b"\0" * (-file_entry.size % tarfile.BLOCKSIZE))
 
-    def execute(self) -> None:
-        while True:
-            client_socket, client_address = self.__sock.accept()
+        writer.write(b"\0" * (2 * tarfile.BLOCKSIZE))
+        await writer.drain()
 
-            client_thread = threading.Thread(
-                target=self.__handle_client, args=(client_socket,)
+    async def __client_chat(
+        self, room: str, writer: asyncio.StreamWriter, read_task: asyncio.Future
+    ) -> None:
+        # Nothing would ever be published to a room without a source
+        if room not in self.__chat_sources:
+            writer.write(Response(status=403, message="Chat room not found").encode())
+            await writer.drain()
+            return
+
+        subscription = self.__chat_broker.subscribe(room=room, writer=writer)
+
+        if room in self.__ended_chat_rooms:
+            # This client got the rest of the room and its end
+            self.__ended_chat_rooms.discard(room)
+            del self.__chat_sources[room]
+        closed_task = asyncio.ensure_future(subscription.closed.wait())
+
+        try:
+            # The client's next frame, or its disconnection, also ends the
+            # chat. The read is left running for the caller to handle
+            await asyncio.wait(
+                {closed_task, read_task}, return_when=asyncio.FIRST_COMPLETED
             )
 
-            client_thread.start()
+        finally:
+            closed_task.cancel()
+
+            if not subscription.closed.is_set():
+                self.__chat_broker.unsubscribe(subscription=subscription)
+
+                if not writer.is_closing():
+                    writer.write(Frame(message_type=MessageType.CHAT_END).encode())
+
+        await writer.drain()
+
+    def __get_default_chat_source(self) -> Iterable[str]:
+        try:
+            import keyboard  # noqa: F401
+
+            return KeyboardSource()
+
+        except ImportError:
+            return StdinSource()
+
+    def __pump_chat_source(
+        self, loop: asyncio.AbstractEventLoop, room: str, chat_source: Iterable[str]
+    ) -> None:
+        for text in chat_source:
+            loop.call_soon_threadsafe(self.__chat_broker.publish, room, text)
+
+        loop.call_soon_threadsafe(self.__end_chat_room, room)
+
+    def __end_chat_room(self, room: str) -> None:
+        # Nothing will be published to the room again, later clients are
+        # told it doesn't exist
+        if self.__chat_broker.end(room=room):
+            self.__ended_chat_rooms.add(room)
+
+        else:
+            del self.__chat_sources[room]
+
+    async def __handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if self.__connections >= self.__max_connections:
+            writer.write(Response(status=503, message="Server busy").encode())
+            await self.__close(writer=writer)
+            return
+
+        self.__connections += 1
+        writer.transport.set_write_buffer_limits(high=self.__write_buffer_size)
+
+        # A read started during a chat carries over to the next iteration
+        read_task: Optional[asyncio.Future] = None
+
+        try:
+            while True:
+                if read_task is None:
+                    read_task = asyncio.ensure_future(Frame.read_async(reader))
+
+                # Requests are framed, so several can arrive in one segment
+                # (pipelining) and are answered in order
+                frame = await asyncio.wait_for(
+                    asyncio.shield(read_task), timeout=self.__idle_timeout
+                )
+                read_task = None
+
+                if frame is None or frame.message_type == MessageType.EXIT:
+                    break
+
+                if frame.message_type == MessageType.CHAT:
+                    read_task = asyncio.ensure_future(Frame.read_async(reader))
+
+                    await self.__client_chat(
+                        room=frame.header.decode("utf-8") or self.__chat_room,
+                        writer=writer,
+                        read_task=read_task,
+                    )
+
+                elif frame.message_type == MessageType.RANGE_REQUEST:
+                    range_request = RangeRequest.decode(frame)
+
+                    await self.__client_file_request(
+                        file_path=range_request.file_path,
+                        writer=writer,
+                        offset=range_request.offset,
+                        length=range_request.length,
+                    )
+
+                elif frame.message_type == MessageType.RESUME_REQUEST:
+                    await self.__client_resume_request(
+                        resume_request=ResumeRequest.decode(frame), writer=writer
+                    )
+
+                elif frame.message_type == MessageType.LIST_REQUEST:
+                    await self.__client_list_request(
+                        directory=frame.header.decode("utf-8"), writer=writer
+                    )
+
+                elif frame.message_type == MessageType.BULK_REQUEST:
+                    await self.__client_bulk_request(
+                        bulk_request=BulkRequest.decode(frame), writer=writer
+                    )
+
+                elif frame.message_type == MessageType.FILE_REQUEST:
+                    file_request = FileRequest.decode(frame)
+
+                    await self.__client_file_request(
+                        file_path=file_request.file_path,
+                        writer=writer,
+                        accept_encoding=file_request.accept_encoding,
+                    )
+
+                else:
+                    writer.write(
+                        Response(status=400, message="Unexpected message").encode()
+                    )
+                    await writer.drain()
+
+        except (asyncio.TimeoutError, ConnectionError, ValueError, TypeError):
+            # TypeError is a request header with keys its request doesn't have
+            pass
+
+        finally:
+            if read_task is not None:
+                read_task.cancel()
+
+            self.__connections -= 1
+            await self.__close(writer=writer)
+
+    async def __close(self, writer: asyncio.StreamWriter) -> None:
+        writer.close()
+
+        try:
+            await writer.wait_closed()
+
+        except ConnectionError:
+            pass
+
+    async def __serve(self) -> None:
+        server = await asyncio.start_server(
+            self.__handle_client,
+            host=self.__ip,
+            port=self.__port,
+            backlog=self.__backlog,
+            reuse_address=True,
+        )
+
+        # Sources block on their input, so each is read on its own thread
+        for room, chat_source in self.__chat_sources.items():
+            threading.Thread(
+                target=self.__pump_chat_source,
+                args=(asyncio.get_running_loop(), room, chat_source),
+                daemon=True,
+            ).start()
+
+        async with server:
+            await server.serve_forever()
+
+    def execute(self) -> None:
+        asyncio.run(self.__serve())
 
 
 if __name__ == "__main__":
@@ -1 +1,6 @@
+from .body_reader import BodyReader
 from .calculate_checksum import CalculateChecksum
+from .chat_broker import ChatBroker, ChatSubscription
+from .chat_sources import IterableSource, KeyboardSource, SocketSource, StdinSource
+from .compression import Compression
+from .file_cache import CachedFile, FileCache
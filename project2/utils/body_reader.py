@@ -0,0 +1,25 @@
+from typing import BinaryIO
+
+
+class BodyReader:
+    # File-like view of a frame body, reads never go past its end so the
+    # frames behind it stay in the stream
+    def __init__(self, stream: BinaryIO, length: int) -> None:
+        self.__stream = stream
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.__stream.read(size)
+
+        if len(data) < size:
+            raise ConnectionError("Connection closed mid body")
+
+        self.remaining -= len(data)
+        return data
+
+    def drain(self, read_size: int = 256 * 1024) -> None:
+        while self.remaining:
+            self.read(min(read_size, self.remaining))
@@ -1,13 +1,154 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
 import hashlib
+import os
+import threading
 
 
 class CalculateChecksum:
+    # Algorithms with a fixed digest length, the SHAKE ones need a length
+    # for hexdigest
+    ALGORITHMS = frozenset(
+        algorithm
+        for algorithm in hashlib.algorithms_guaranteed
+        if not algorithm.startswith("shake_")
+    )
+
+    # Whole-file digests by (path, algorithm, None), valid while the file
+    # keeps the same inode, modification time and size. Prefix lengths come
+    # from clients, so their digests are only shared while being computed
+    __cache: Dict[Tuple[str, str, Optional[int]], Tuple[Tuple[int, int, int], str]] = {}
+
+    # Hashes still running, so concurrent requests for a file that isn't
+    # cached yet wait on one hash instead of each starting their own
+    __pending: Dict[
+        Tuple[str, str, Optional[int]], Tuple[Tuple[int, int, int], Future]
+    ] = {}
+    __cache_lock = threading.Lock()
+
+    # hashlib releases the GIL on large updates, so hashing threads run in
+    # parallel with each other and with the request path
+    __executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+    @classmethod
+    def execute(
+        cls,
+        file_path: str,
+        algorithm: str = "sha256",
+        read_size: int = 1024 * 1024,
+        length: Optional[int] = None,
+    ) -> str:
+        # Only the first length bytes are hashed when it is given
+        future, run = cls.__claim(
+            file_path=file_path,
+            algorithm=algorithm,
+            read_size=read_size,
+            length=length,
+        )
+
+        if run is not None:
+            run()
+
+        return future.result()
+
+    @classmethod
+    def submit(
+        cls,
+        file_path: str,
+        algorithm: str = "sha256",
+        read_size: int = 1024 * 1024,
+        length: Optional[int] = None,
+    ) -> Future:
+        try:
+            future, run = cls.__claim(
+                file_path=file_path,
+                algorithm=algorithm,
+                read_size=read_size,
+                length=length,
+            )
+
+        except OSError as e:
+            future, run = Future(), None
+            future.set_exception(e)
+
+        if run is not None:
+            cls.__executor.submit(run)
+
+        return future
+
+    @classmethod
+    def __claim(
+        cls, file_path: str, algorithm: str, read_size: int, length: Optional[int]
+    ) -> Tuple[Future, Optional[Callable[[], None]]]:
+        # The future of the digest, and the hash to run when there is no
+        # cached or running one to share
+        stat = os.stat(file_path)
+        validator = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        key = (os.path.abspath(file_path), algorithm, length)
+
+        with cls.__cache_lock:
+            cached = cls.__cache.get(key)
+
+            if cached is not None and cached[0] == validator:
+                future = Future()
+                future.set_result(cached[1])
+                return future, None
+
+            pending = cls.__pending.get(key)
+
+            if pending is not None and pending[0] == validator:
+                return pending[1], None
+
+            future = Future()
+            cls.__pending[key] = (validator, future)
+
+        def run() -> None:
+            try:
+                checksum = cls.__hash(
+                    file_path=file_path,
+                    algorithm=algorithm,
+                    read_size=read_size,
+                    length=stat.st_size if length is None else length,
+                )
+
+            except BaseException as e:
+                cls.__forget_pending(key=key, future=future)
+                future.set_exception(e)
+                return
+
+            if length is None:
+                with cls.__cache_lock:
+                    cls.__cache[key] = (validator, checksum)
+
+            cls.__forget_pending(key=key, future=future)
+            future.set_result(checksum)
+
+        return future, run
+
     @classmethod
-    def execute(cls, file_path: str) -> str:
-        hash_function = getattr(hashlib, "sha256")()
+    def __forget_pending(
+        cls, key: Tuple[str, str, Optional[int]], future: Future
+    ) -> None:
+        with cls.__cache_lock:
+            # A newer version of the file may have started its own hash
+            if cls.__pending.get(key, (None, None))[1] is future:
+                del cls.__pending[key]
+
+    @classmethod
+    def __hash(cls, file_path: str, algorithm: str, read_size: int, length: int) -> str:
+        hash_function = getattr(hashlib, algorithm)()
+        buffer = memoryview(bytearray(read_size))
+        remaining = length
+
+        with open(file_path, "rb", buffering=0) as file:
+            while remaining > 0:
+                read_bytes = file.readinto(buffer[: min(read_size, remaining)])
+
+                if not read_bytes:
+                    break
 
-        with open(file_path, "rb") as file:
-            for chunk in iter(lambda: file.read(4096), b""):
-                hash_function.update(chunk)
+                hash_function.update(buffer[:read_bytes])
+                remaining -= read_bytes
 
         return hash_function.hexdigest()
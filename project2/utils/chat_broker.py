@@ -0,0 +1,131 @@
+from models.frame import Frame, MessageType
+from typing import Dict, List, Set
+
+import asyncio
+
+
+class ChatSubscription:
+    def __init__(self, room: str, writer: asyncio.StreamWriter) -> None:
+        self.room = room
+        self.writer = writer
+
+        # Set once the chat is over for this client
+        self.closed = asyncio.Event()
+
+
+class ChatBroker:
+    # Ends the chat of a room, the character the escape key types
+    END = "\x1b"
+
+    def __init__(
+        self, flush_interval: float = 0.05, max_buffered_bytes: int = 64 * 1024
+    ) -> None:
+        # Keystrokes published within flush_interval go out as one frame
+        self.__flush_interval = flush_interval
+
+        # Clients whose outbound buffer grows past this are dropped from
+        # the chat instead of holding everyone else back
+        self.__max_buffered_bytes = max_buffered_bytes
+
+        self.__subscriptions: Dict[str, Set[ChatSubscription]] = {}
+        self.__pending: Dict[str, List[str]] = {}
+
+        # Text published while nobody is in a room, replayed to the first
+        # client that joins. Only the last max_buffered_bytes are kept
+        self.__backlog: Dict[str, str] = {}
+        self.__flush_handles: Dict[str, asyncio.TimerHandle] = {}
+
+    def subscribe(self, room: str, writer: asyncio.StreamWriter) -> ChatSubscription:
+        subscription = ChatSubscription(room=room, writer=writer)
+        self.__subscriptions.setdefault(room, set()).add(subscription)
+
+        backlog = self.__backlog.pop(room, "")
+        if backlog:
+            self.publish(room=room, text=backlog)
+
+        return subscription
+
+    def unsubscribe(self, subscription: ChatSubscription) -> None:
+        subscriptions = self.__subscriptions.get(subscription.room, set())
+        subscriptions.discard(subscription)
+
+        if not subscriptions:
+            self.__forget_room(room=subscription.room)
+
+        subscription.closed.set()
+
+    def end(self, room: str) -> bool:
+        # The room's source is done. Whoever is in it gets the end, text
+        # nobody received yet is kept with the end for the next client.
+        # Returns whether such text is left
+        if room in self.__subscriptions or room in self.__backlog:
+            self.publish(room=room, text=self.END)
+
+        return room in self.__backlog
+
+    def publish(self, room: str, text: str) -> None:
+        if room not in self.__subscriptions:
+            self.__backlog[room] = (self.__backlog.get(room, "") + text)[
+                -self.__max_buffered_bytes :
+            ]
+            return
+
+        text, end, rest = text.partition(self.END)
+
+        if text:
+            self.__pending.setdefault(room, []).append(text)
+
+            if room not in self.__flush_handles:
+                self.__flush_handles[room] = asyncio.get_running_loop().call_later(
+                    self.__flush_interval, self.__flush, room
+                )
+
+        if end:
+            self.__flush(room=room, end=True)
+
+            # Everyone left with the end, what follows waits for the next
+            # client in the backlog
+            if rest:
+                self.publish(room=room, text=rest)
+
+    def __flush(self, room: str, end: bool = False) -> None:
+        flush_handle = self.__flush_handles.pop(room, None)
+        if flush_handle is not None:
+            flush_handle.cancel()
+
+        text = "".join(self.__pending.pop(room, []))
+
+        # Encoded once, every subscriber gets the same bytes queued on its
+        # own transport
+        data = b""
+        if text:
+            data += Frame(
+                message_type=MessageType.CHAT_KEY, header=text.encode("utf-8")
+            ).encode()
+
+        if end:
+            data += Frame(message_type=MessageType.CHAT_END).encode()
+
+        for subscription in list(self.__subscriptions.get(room, ())):
+            writer = subscription.writer
+
+            if writer.is_closing():
+                self.unsubscribe(subscription=subscription)
+
+            elif writer.transport.get_write_buffer_size() > self.__max_buffered_bytes:
+                writer.close()
+                self.unsubscribe(subscription=subscription)
+
+            else:
+                writer.write(data)
+
+                if end:
+                    self.unsubscribe(subscription=subscription)
+
+    def __forget_room(self, room: str) -> None:
+        self.__subscriptions.pop(room, None)
+        self.__pending.pop(room, None)
+
+        flush_handle = self.__flush_handles.pop(room, None)
+        if flush_handle is not None:
+            flush_handle.cancel()
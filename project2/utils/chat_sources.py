@@ -0,0 +1,86 @@
+from .chat_broker import ChatBroker
+from typing import Iterable, Iterator
+
+import socket
+import sys
+
+
+class KeyboardSource:
+    # Global keyboard hook of the server machine, needs the optional
+    # keyboard package and usually root
+    CONTROL_KEYS = {
+        "right shift",
+        "left shift",
+        "shift",
+        "right ctrl",
+        "left ctrl",
+        "ctrl",
+        "backspace",
+        "delete",
+        "alt gr",
+        "alt",
+        "tab",
+        "up",
+        "right",
+        "down",
+        "left",
+    }
+
+    def __iter__(self) -> Iterator[str]:
+        import keyboard
+
+        while True:
+            event = keyboard.read_event()
+
+            if event.event_type != "down":
+                continue
+
+            if event.name == "esc":
+                yield ChatBroker.END
+
+            elif event.name == "space":
+                yield " "
+
+            elif event.name == "enter":
+                yield "\n"
+
+            elif event.name not in self.CONTROL_KEYS:
+                yield event.name
+
+
+class StdinSource:
+    def __iter__(self) -> Iterator[str]:
+        # Line by line, end of input ends the chat
+        for line in sys.stdin:
+            yield line
+
+        yield ChatBroker.END
+
+
+class SocketSource:
+    def __init__(self, sock: socket.socket, receive_size: int = 4096) -> None:
+        # Whatever a connected peer sends, its disconnection ends the chat
+        self.__sock = sock
+        self.__receive_size = receive_size
+
+    def __iter__(self) -> Iterator[str]:
+        with self.__sock:
+            while True:
+                data = self.__sock.recv(self.__receive_size)
+
+                if not data:
+                    break
+
+                yield data.decode("utf-8", errors="replace")
+
+        yield ChatBroker.END
+
+
+class IterableSource:
+    def __init__(self, texts: Iterable[str]) -> None:
+        # Fixed feed, mostly for tests. What is published before anyone
+        # joins waits in the broker's backlog
+        self.__texts = texts
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.__texts
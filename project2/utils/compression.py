@@ -0,0 +1,88 @@
+from typing import Optional, Sequence
+
+import lzma
+import os
+import zlib
+
+
+class Compression:
+    # Server preference order, the first one the client accepts is used
+    ENCODINGS = ("zlib", "lzma")
+
+    # Already compressed formats, sampling them would only waste time
+    INCOMPRESSIBLE_EXTENSIONS = {
+        ".7z",
+        ".avi",
+        ".br",
+        ".bz2",
+        ".gif",
+        ".gz",
+        ".jpeg",
+        ".jpg",
+        ".mkv",
+        ".mov",
+        ".mp3",
+        ".mp4",
+        ".ogg",
+        ".pdf",
+        ".png",
+        ".rar",
+        ".tgz",
+        ".webm",
+        ".webp",
+        ".xz",
+        ".zip",
+        ".zst",
+    }
+
+    # Below this the frames cost more than compression saves
+    MIN_SIZE = 1024
+
+    @classmethod
+    def choose(
+        cls,
+        file_path: str,
+        size: int,
+        sample: bytes,
+        accepted: Sequence[str],
+        encodings: Sequence[str] = ENCODINGS,
+        max_ratio: float = 0.9,
+    ) -> Optional[str]:
+        # None when the file should go out as it is
+        encoding = next(
+            (encoding for encoding in encodings if encoding in accepted), None
+        )
+
+        if (
+            encoding is None
+            or size < cls.MIN_SIZE
+            or os.path.splitext(file_path)[1].lower() in cls.INCOMPRESSIBLE_EXTENSIONS
+        ):
+            return None
+
+        # A fast pass over a sample tells random or packed data apart from
+        # text, whatever the extension says
+        if len(zlib.compress(sample, 1)) > len(sample) * max_ratio:
+            return None
+
+        return encoding
+
+    @classmethod
+    def compressor(cls, encoding: str):
+        if encoding == "zlib":
+            return zlib.compressobj(6)
+
+        if encoding == "lzma":
+            return lzma.LZMACompressor(preset=1)
+
+        raise ValueError(f"Unknown encoding {encoding}")
+
+    @classmethod
+    def decompressor(cls, encoding: str):
+        if encoding == "zlib":
+            return zlib.decompressobj()
+
+        if encoding == "lzma":
+            return lzma.LZMADecompressor()
+
+        raise ValueError(f"Unknown encoding {encoding}")
@@ -1 +1,2 @@
+from .headers import Headers
 from .http_request import HTTPRequest
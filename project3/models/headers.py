@@ -0,0 +1,32 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class Headers:
+    # Case-insensitive, keeps repeated headers and the order they came in
+    def __init__(self) -> None:
+        self.__items: List[Tuple[str, str]] = []
+        self.__values: Dict[str, List[str]] = {}
+
+    def add(self, name: str, value: str) -> None:
+        self.__items.append((name, value))
+        self.__values.setdefault(name.lower(), []).append(value)
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.__values.get(name.lower())
+
+        return values[0] if values else default
+
+    def get_all(self, name: str) -> List[str]:
+        return list(self.__values.get(name.lower(), ()))
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self.__values
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return iter(self.__items)
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def __repr__(self) -> str:
+        return f"Headers({self.__items!r})"
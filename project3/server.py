@@ -1,13 +1,34 @@
 from models.http_request import HTTPRequest
-from typing import Dict, Tuple
+from utils.http_parser import HTTPParseError, HTTPParser
+from utils.parse_range import ParseRange
+from utils.response_cache import CachedResponse, ResponseCache
+from utils.send_file import SendFile
+from typing import Dict, List, Optional, Tuple
+from email.utils import parsedate_to_datetime
 
 import os
+import secrets
 import socket
 import threading
 
 
 class Server:
-    def __init__(self, ip: str = "localhost", port: int = 8082) -> None:
+    def __init__(
+        self,
+        ip: str = "localhost",
+        port: int = 8082,
+        idle_timeout: float = 5.0,
+        max_requests: int = 100,
+        max_request_head_size: int = 64 * 1024,
+        max_request_headers: int = 100,
+        max_request_body_size: int = 1024 * 1024,
+        receive_size: int = 64 * 1024,
+        response_cache_size: int = 32 * 1024 * 1024,
+        response_cache_max_body_size: int = 1024 * 1024,
+        cache_policies: Optional[Dict[str, str]] = None,
+        default_cache_policy: str = "no-cache",
+        max_ranges: int = 16,
+    ) -> None:
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.__sock.bind((ip, port))
@@ -17,9 +38,43 @@ class Server:
 
         self.__server_files_root_dir = "server_files/"
 
+        # Connections are kept open between requests until the client asks
+        # otherwise, stays silent for idle_timeout or has sent max_requests
+        self.__idle_timeout = idle_timeout
+        self.__max_requests = max_requests
+
+        # Requests over these limits are refused before they are buffered
+        self.__max_request_head_size = max_request_head_size
+        self.__max_request_headers = max_request_headers
+        self.__max_request_body_size = max_request_body_size
+        self.__receive_size = receive_size
+
+        # Encoded responses by path, small bodies in memory and large ones
+        # as descriptors for sendfile
+        self.__response_cache = ResponseCache(
+            max_bytes=response_cache_size, max_body_size=response_cache_max_body_size
+        )
+
+        # Cache-Control by content type. Pages are revalidated on every
+        # visit, which costs a 304 when they haven't changed
+        self.__cache_policies = (
+            {"text/html": "no-cache", "image/jpeg": "public, max-age=86400"}
+            if cache_policies is None
+            else cache_policies
+        )
+        self.__default_cache_policy = default_cache_policy
+
+        # Range requests for more pieces than this get the whole file
+        self.__max_ranges = max_ranges
+
+        # Every connection header a response can need, built once
+        self.__connection_headers = self.__build_connection_headers()
+
     ########################################## File Handlers ##########################################
 
     def __get_file_content_type(self, file_extension: str) -> str:
+        content_type = "application/octet-stream"
+
         if file_extension == "html":
             content_type = "text/html"
 
@@ -28,150 +83,475 @@ class Server:
 
         return content_type
 
-    def __get_server_file(self, file_path: str) -> bytes:
-        with open(file=self.__server_files_root_dir + file_path, mode="rb") as f:
-            file_content = f.read()
-
-        return file_content
+    def __get_cache_policy(self, content_type: str) -> str:
+        return self.__cache_policies.get(content_type, self.__default_cache_policy)
 
-    def __file_request_handler(self, file: str) -> Tuple[str, str]:
-        file_extension = file.split(".")[1]
+    def __check_file_existency(self, file_path: str) -> bool:
+        if os.path.isfile(self.__server_files_root_dir + file_path):
+            return True
 
-        content_type = self.__get_file_content_type(file_extension=file_extension)
+        return False
 
-        file = self.__get_server_file(file_path=file)
+    def __is_not_modified(
+        self, request: HTTPRequest, cached_response: CachedResponse
+    ) -> bool:
+        if request.method not in ("GET", "HEAD"):
+            return False
 
-        response = (
-            "HTTP/1.1 200 OK\r\n"
-            f"Content-Type: {content_type}\r\n"
-            f"Content-Length: {len(file)}\r\n"
-            "\r\n"
-        )
+        # If-None-Match wins over If-Modified-Since when both are sent,
+        # tags are compared weakly
+        if_none_match = request.headers.get_all("if-none-match")
 
-        return response, file
+        if if_none_match:
+            etags = {
+                etag.strip().removeprefix("W/")
+                for value in if_none_match
+                for etag in value.split(",")
+            }
 
-    def __file_doesnt_exist_handler(self) -> str:
-        file = self.__get_html_file("/file_not_found.html")
+            return "*" in etags or cached_response.etag in etags
 
-        response = (
-            "HTTP/1.1 404 File not found\r\n"
-            "Content-Type: text/html\r\n"
-            f"Content-Length: {len(file)}\r\n"
-            "\r\n"
-            f"{file}"
-        )
+        if_modified_since = request.headers.get("if-modified-since")
 
-        return response
+        if if_modified_since is None:
+            return False
 
-    def __check_file_existency(self, file_path: str) -> bool:
-        if os.path.exists(self.__server_files_root_dir + file_path):
-            return True
+        try:
+            modified_since = parsedate_to_datetime(if_modified_since).timestamp()
 
-        return False
+        except (TypeError, ValueError):
+            return False
 
-    def __get_html_file(self, file_path: str) -> str:
-        if "/" in file_path:
-            file_path = file_path[1:]
+        return cached_response.last_modified <= modified_since
 
-        with open(file=file_path, mode="r") as f:
-            html_content = f.read()
+    def __is_range_current(
+        self, request: HTTPRequest, cached_response: CachedResponse
+    ) -> bool:
+        # With If-Range the pieces are only sent if the client's copy is
+        # still the current one, otherwise it gets the whole file again
+        if_range = request.headers.get("if-range")
 
-        return html_content
+        if if_range is None:
+            return True
 
-    ######################################################################################################
+        if if_range.startswith(("W/", '"')):
+            return if_range == cached_response.etag
 
-    ########################################## Request Handlers ##########################################
+        try:
+            return (
+                parsedate_to_datetime(if_range).timestamp()
+                == cached_response.last_modified
+            )
 
-    def __get_query_strings(self, url: str) -> Dict[str, str]:
-        result = {}
+        except (TypeError, ValueError):
+            return False
 
-        query_strings = url.split("?")[1:]
+    def __get_ranges(
+        self, request: HTTPRequest, cached_response: CachedResponse
+    ) -> Optional[List[Tuple[int, int]]]:
+        range_header = request.headers.get("range")
 
-        for query_string in query_strings:
-            key, value = query_string.split("=")
-            result[key] = value
+        if (
+            request.method != "GET"
+            or range_header is None
+            or not self.__is_range_current(
+                request=request, cached_response=cached_response
+            )
+        ):
+            return None
 
-        return result
+        return ParseRange.execute(
+            range_header=range_header,
+            size=cached_response.size,
+            max_ranges=self.__max_ranges,
+        )
 
-    def __get_endpoint(self, url: str) -> str:
-        return url.split("?")[0]
+    def __send_body_range(
+        self,
+        client_socket: socket.socket,
+        cached_response: CachedResponse,
+        offset: int,
+        length: int,
+    ) -> None:
+        if cached_response.body is None:
+            SendFile.execute(
+                sock=client_socket, fd=cached_response.fd, offset=offset, length=length
+            )
 
-    def __parse_http_request(self, http_request: str) -> HTTPRequest:
-        http_request_dict = {}
+        else:
+            client_socket.sendall(
+                memoryview(cached_response.body)[offset : offset + length]
+            )
 
-        # Check if request is not empty
-        if http_request:
-            # Separate each line of the HTTP request
-            http_lines = http_request.strip().split("\n")
+    def __send_ranges(
+        self,
+        client_socket: socket.socket,
+        cached_response: CachedResponse,
+        connection_headers: bytes,
+        ranges: List[Tuple[int, int]],
+    ) -> None:
+        size = cached_response.size
+
+        if not ranges:
+            self.__send_buffers(
+                client_socket=client_socket,
+                buffers=[
+                    (
+                        "HTTP/1.1 416 Range Not Satisfiable\r\n"
+                        f"Content-Range: bytes */{size}\r\n"
+                        "Content-Length: 0\r\n"
+                    ).encode("utf-8"),
+                    connection_headers,
+                ],
+            )
+            return
+
+        if len(ranges) == 1:
+            offset, length = ranges[0]
+            head = (
+                "HTTP/1.1 206 Partial Content\r\n"
+                f"Content-Type: {cached_response.content_type}\r\n"
+                f"Content-Length: {length}\r\n"
+                f"Content-Range: bytes {offset}-{offset + length - 1}/{size}\r\n"
+            ).encode("utf-8")
+
+            self.__send_buffers(
+                client_socket=client_socket,
+                buffers=[head, cached_response.validators, connection_headers],
+            )
+            self.__send_body_range(
+                client_socket=client_socket,
+                cached_response=cached_response,
+                offset=offset,
+                length=length,
+            )
+            return
+
+        # Several pieces go as multipart/byteranges, the part headers are
+        # built first so the body length is known
+        boundary = secrets.token_hex(16)
+        part_heads = [
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {cached_response.content_type}\r\n"
+                f"Content-Range: bytes {offset}-{offset + length - 1}/{size}\r\n"
+                "\r\n"
+            ).encode("utf-8")
+            for offset, length in ranges
+        ]
+        tail = f"\r\n--{boundary}--\r\n".encode("utf-8")
+        body_length = (
+            sum(len(part_head) for part_head in part_heads)
+            + sum(length for _, length in ranges)
+            + len(tail)
+        )
+        head = (
+            "HTTP/1.1 206 Partial Content\r\n"
+            f"Content-Type: multipart/byteranges; boundary={boundary}\r\n"
+            f"Content-Length: {body_length}\r\n"
+        ).encode("utf-8")
+
+        self.__send_buffers(
+            client_socket=client_socket,
+            buffers=[head, cached_response.validators, connection_headers],
+        )
 
-            # Handle request line
-            http_request_line = http_lines[0]
-            http_request_line_words = http_request_line.strip().split(" ")
-            http_request_dict.update(
-                {
-                    "method": http_request_line_words[0],
-                    "endpoint": self.__get_endpoint(http_request_line_words[1]),
-                    "query_strings": self.__get_query_strings(
-                        http_request_line_words[1]
-                    ),
-                    "http_version": http_request_line_words[2],
-                }
+        for part_head, (offset, length) in zip(part_heads, ranges):
+            client_socket.sendall(part_head)
+            self.__send_body_range(
+                client_socket=client_socket,
+                cached_response=cached_response,
+                offset=offset,
+                length=length,
             )
 
-            # Handle header lines
-            http_request_headers_lines = http_lines[1:]
-            for http_request_header_line in http_request_headers_lines:
-                header, value = http_request_header_line.strip().split(": ")
-                header = header.lower().replace("-", "_")
-                http_request_dict[header] = value
+        client_socket.sendall(tail)
 
-        return HTTPRequest(**http_request_dict)
+    def __send_cached_response(
+        self,
+        client_socket: socket.socket,
+        cached_response: CachedResponse,
+        connection_headers: bytes,
+        request: Optional[HTTPRequest] = None,
+        head_only: bool = False,
+    ) -> None:
+        # HEAD gets the headers alone, a body would be read as the start of
+        # the next response on a kept-alive connection
+        if head_only or (request is not None and request.method == "HEAD"):
+            self.__send_buffers(
+                client_socket=client_socket,
+                buffers=[cached_response.head, connection_headers],
+            )
+            return
+
+        # Conditional requests the client's copy still satisfies get the
+        # validators and no body
+        if request is not None and self.__is_not_modified(
+            request=request, cached_response=cached_response
+        ):
+            self.__send_buffers(
+                client_socket=client_socket,
+                buffers=[cached_response.not_modified_head, connection_headers],
+            )
+            return
 
-    def __handle_client(self, client_socket: socket.socket) -> None:
-        http_request = client_socket.recv(1024).decode("utf-8")
+        ranges = (
+            None
+            if request is None
+            else self.__get_ranges(request=request, cached_response=cached_response)
+        )
+
+        if ranges is not None:
+            self.__send_ranges(
+                client_socket=client_socket,
+                cached_response=cached_response,
+                connection_headers=connection_headers,
+                ranges=ranges,
+            )
 
-        parsed_request = self.__parse_http_request(http_request=http_request)
+        elif cached_response.body is None:
+            self.__send_buffers(
+                client_socket=client_socket,
+                buffers=[cached_response.head, connection_headers],
+            )
 
-        if parsed_request.endpoint == "/home.html":
-            self.__home_endpoint(client_socket=client_socket)
+            # The body goes from the page cache to the socket, the file
+            # is never read into memory
+            SendFile.execute(
+                sock=client_socket,
+                fd=cached_response.fd,
+                offset=0,
+                length=cached_response.size,
+            )
 
-        if parsed_request.endpoint == "/get_file":
-            self.__get_file_endpoint(
-                client_socket=client_socket, request=parsed_request
+        else:
+            self.__send_buffers(
+                client_socket=client_socket,
+                buffers=[
+                    cached_response.head,
+                    connection_headers,
+                    cached_response.body,
+                ],
             )
 
-        client_socket.close()
+    def __send_buffers(
+        self, client_socket: socket.socket, buffers: List[bytes]
+    ) -> None:
+        # One system call for head and body, without joining them first
+        sent = client_socket.sendmsg(buffers)
 
-    ##############################################################################################
+        for buffer in buffers:
+            if sent >= len(buffer):
+                sent -= len(buffer)
+                continue
 
-    ########################################## Endpoints ##########################################
+            client_socket.sendall(memoryview(buffer)[sent:])
+            sent = 0
+
+    ######################################################################################################
 
-    def __home_endpoint(self, client_socket: socket.socket) -> None:
-        html_content = self.__get_html_file(file_path="/home.html")
+    ########################################## Request Handlers ##########################################
 
+    def __is_keep_alive(self, request: HTTPRequest) -> bool:
+        # HTTP/1.1 connections persist unless closed explicitly, HTTP/1.0
+        # ones only when asked to
+        connection = {
+            token.strip().lower()
+            for value in request.headers.get_all("connection")
+            for token in value.split(",")
+        }
+
+        if request.http_version == "HTTP/1.1":
+            return "close" not in connection
+
+        return "keep-alive" in connection
+
+    def __build_connection_headers(self) -> List[bytes]:
+        # Indexed by requests handled on the connection, the last one closes
+        # it. They end the header block
+        return [
+            (
+                "Connection: keep-alive\r\n"
+                f"Keep-Alive: timeout={int(self.__idle_timeout)}, "
+                f"max={self.__max_requests - handled}\r\n"
+                "\r\n"
+            ).encode("utf-8")
+            for handled in range(self.__max_requests)
+        ] + [b"Connection: close\r\n\r\n"]
+
+    def __get_connection_headers(self, keep_alive: bool, handled: int) -> bytes:
+        if not keep_alive:
+            return self.__connection_headers[-1]
+
+        return self.__connection_headers[handled]
+
+    def __receive_request(
+        self, client_socket: socket.socket, parser: HTTPParser, buffer: memoryview
+    ) -> Optional[HTTPRequest]:
+        # Pipelined requests are already buffered in the parser, the socket
+        # is only read when it has no complete request left
+        request = parser.next_request()
+
+        while request is None:
+            received = client_socket.recv_into(buffer)
+
+            if not received:
+                return None
+
+            parser.feed(buffer[:received])
+            request = parser.next_request()
+
+        return request
+
+    def __error_handler(self, status: int, reason: str) -> str:
         response = (
-            "HTTP/1.1 200 OK\r\n"
-            "Content-Type: text/html\r\n"
-            f"Content-Length: {len(html_content)}\r\n"
+            f"HTTP/1.1 {status} {reason}\r\n"
+            "Content-Length: 0\r\n"
+            "Connection: close\r\n"
             "\r\n"
-            f"{html_content}"
         )
 
-        client_socket.sendall(response.encode("utf-8"))
+        return response
+
+    def __handle_client(self, client_socket: socket.socket) -> None:
+        client_socket.settimeout(self.__idle_timeout)
+        parser = HTTPParser(
+            max_head_size=self.__max_request_head_size,
+            max_headers=self.__max_request_headers,
+            max_body_size=self.__max_request_body_size,
+        )
+        buffer = memoryview(bytearray(self.__receive_size))
+
+        try:
+            for handled in range(1, self.__max_requests + 1):
+                try:
+                    parsed_request = self.__receive_request(
+                        client_socket=client_socket, parser=parser, buffer=buffer
+                    )
+
+                except HTTPParseError as e:
+                    client_socket.sendall(
+                        self.__error_handler(status=e.status, reason=e.reason).encode(
+                            "utf-8"
+                        )
+                    )
+                    break
+
+                if parsed_request is None:
+                    break
+
+                keep_alive = (
+                    self.__is_keep_alive(request=parsed_request)
+                    and handled < self.__max_requests
+                )
+                connection_headers = self.__get_connection_headers(
+                    keep_alive=keep_alive, handled=handled
+                )
+
+                if parsed_request.endpoint == "/home.html":
+                    self.__home_endpoint(
+                        client_socket=client_socket,
+                        request=parsed_request,
+                        connection_headers=connection_headers,
+                    )
+
+                elif parsed_request.endpoint == "/get_file":
+                    self.__get_file_endpoint(
+                        client_socket=client_socket,
+                        request=parsed_request,
+                        connection_headers=connection_headers,
+                    )
+
+                else:
+                    self.__file_doesnt_exist_endpoint(
+                        client_socket=client_socket,
+                        request=parsed_request,
+                        connection_headers=connection_headers,
+                    )
+
+                if not keep_alive:
+                    break
+
+        except (socket.timeout, ConnectionError, EOFError):
+            pass
+
+        finally:
+            client_socket.close()
+
+    ##############################################################################################
+
+    ########################################## Endpoints ##########################################
+
+    def __home_endpoint(
+        self,
+        client_socket: socket.socket,
+        request: HTTPRequest,
+        connection_headers: bytes,
+    ) -> None:
+        with self.__response_cache.open(
+            file_path="home.html",
+            status="200 OK",
+            content_type="text/html",
+            cache_control=self.__get_cache_policy(content_type="text/html"),
+        ) as cached_response:
+            self.__send_cached_response(
+                client_socket=client_socket,
+                cached_response=cached_response,
+                connection_headers=connection_headers,
+                request=request,
+            )
+
+    def __file_doesnt_exist_endpoint(
+        self,
+        client_socket: socket.socket,
+        request: HTTPRequest,
+        connection_headers: bytes,
+    ) -> None:
+        with self.__response_cache.open(
+            file_path="file_not_found.html",
+            status="404 File not found",
+            content_type="text/html",
+            cache_control="no-cache",
+        ) as cached_response:
+            self.__send_cached_response(
+                client_socket=client_socket,
+                cached_response=cached_response,
+                connection_headers=connection_headers,
+                head_only=request.method == "HEAD",
+            )
 
     def __get_file_endpoint(
-        self, client_socket: socket.socket, request: HTTPRequest
+        self,
+        client_socket: socket.socket,
+        request: HTTPRequest,
+        connection_headers: bytes,
     ) -> None:
         requested_file = request.query_strings.get("file")
 
-        if self.__check_file_existency(file_path=requested_file):
-            response, file = self.__file_request_handler(file=requested_file)
-            client_socket.sendall(response.encode("utf-8"))
-            client_socket.sendall(file)
+        if requested_file and self.__check_file_existency(file_path=requested_file):
+            content_type = self.__get_file_content_type(
+                file_extension=os.path.splitext(requested_file)[1][1:].lower()
+            )
+
+            with self.__response_cache.open(
+                file_path=self.__server_files_root_dir + requested_file,
+                status="200 OK",
+                content_type=content_type,
+                cache_control=self.__get_cache_policy(content_type=content_type),
+            ) as cached_response:
+                self.__send_cached_response(
+                    client_socket=client_socket,
+                    cached_response=cached_response,
+                    connection_headers=connection_headers,
+                    request=request,
+                )
 
         else:
-            response = self.__file_doesnt_exist_handler()
-            client_socket.sendall(response.encode("utf-8"))
+            self.__file_doesnt_exist_endpoint(
+                client_socket=client_socket,
+                request=request,
+                connection_headers=connection_headers,
+            )
 
     ###################################################################################################
 
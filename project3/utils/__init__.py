@@ -0,0 +1,4 @@
+from .http_parser import HTTPParseError, HTTPParser
+from .parse_range import ParseRange
+from .response_cache import CachedResponse, ResponseCache
+from .send_file import SendFile
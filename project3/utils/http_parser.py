@@ -0,0 +1,145 @@
+from models.http_request import HTTPRequest
+from typing import Optional
+from urllib.parse import parse_qsl, unquote
+
+
+class HTTPParseError(ValueError):
+    # Carries the status the server answers with before closing
+    def __init__(self, status: int, reason: str) -> None:
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class HTTPParser:
+    def __init__(
+        self,
+        max_head_size: int = 64 * 1024,
+        max_headers: int = 100,
+        max_body_size: int = 1024 * 1024,
+    ) -> None:
+        self.__max_head_size = max_head_size
+        self.__max_headers = max_headers
+        self.__max_body_size = max_body_size
+
+        # Bytes received and not yet parsed, pipelined requests included
+        self.__buffer = bytearray()
+
+        # Where the search for the end of the head resumes, so bytes
+        # arriving in small pieces are only scanned once
+        self.__scanned = 0
+
+        # Request whose head is parsed and whose body is still arriving
+        self.__request: Optional[HTTPRequest] = None
+        self.__body_start = 0
+        self.__body_length = 0
+
+    def feed(self, data: bytes) -> None:
+        self.__buffer += data
+
+    def next_request(self) -> Optional[HTTPRequest]:
+        # None until a whole request is buffered
+        if self.__request is None:
+            head_end = self.__find_head_end()
+
+            if head_end is None:
+                return None
+
+            # Decoded straight from the buffer, without copying it first
+            with memoryview(self.__buffer) as buffer:
+                head = str(buffer[:head_end], "iso-8859-1")
+
+            self.__request = self.__parse_head(head=head)
+            self.__body_length = self.__get_body_length(request=self.__request)
+
+        body_end = self.__body_start + self.__body_length
+        if len(self.__buffer) < body_end:
+            return None
+
+        request, self.__request = self.__request, None
+        request.body = bytes(self.__buffer[self.__body_start : body_end])
+
+        del self.__buffer[:body_end]
+        self.__scanned = 0
+
+        return request
+
+    def __find_head_end(self) -> Optional[int]:
+        # Lines may end with CRLF or a bare LF, the head ends at the first
+        # empty one
+        while True:
+            line_end = self.__buffer.find(b"\n", self.__scanned)
+
+            if line_end < 0:
+                if len(self.__buffer) > self.__max_head_size:
+                    raise HTTPParseError(431, "Request Header Fields Too Large")
+
+                return None
+
+            line_start = self.__scanned
+            self.__scanned = line_end + 1
+
+            if line_end > self.__max_head_size:
+                raise HTTPParseError(431, "Request Header Fields Too Large")
+
+            if line_end - line_start <= 1 and (
+                line_start == line_end or self.__buffer[line_start] == ord("\r")
+            ):
+                # Empty lines before the request line are allowed
+                if line_start == 0:
+                    del self.__buffer[: self.__scanned]
+                    self.__scanned = 0
+                    continue
+
+                self.__body_start = self.__scanned
+                return line_start
+
+    def __parse_head(self, head: str) -> HTTPRequest:
+        lines = [line.rstrip("\r") for line in head.rstrip("\r\n").split("\n")]
+
+        if len(lines) - 1 > self.__max_headers:
+            raise HTTPParseError(431, "Request Header Fields Too Large")
+
+        request_line = lines[0].split(" ")
+        if len(request_line) != 3 or not request_line[0].isalpha():
+            raise HTTPParseError(400, "Bad Request")
+
+        method, target, http_version = request_line
+        if not http_version.startswith("HTTP/1."):
+            raise HTTPParseError(505, "HTTP Version Not Supported")
+
+        path, _, query = target.partition("?")
+        request = HTTPRequest(
+            method=method,
+            endpoint=unquote(path),
+            query_strings=dict(parse_qsl(query, keep_blank_values=True)),
+            http_version=http_version,
+        )
+
+        for line in lines[1:]:
+            name, separator, value = line.partition(":")
+
+            # Folded lines and names with spaces are not allowed anymore
+            if not separator or not name or name != name.strip():
+                raise HTTPParseError(400, "Bad Request")
+
+            request.headers.add(name, value.strip())
+
+        return request
+
+    def __get_body_length(self, request: HTTPRequest) -> int:
+        if "transfer-encoding" in request.headers:
+            raise HTTPParseError(501, "Not Implemented")
+
+        content_lengths = set(request.headers.get_all("content-length"))
+        if not content_lengths:
+            return 0
+
+        if len(content_lengths) > 1 or not next(iter(content_lengths)).isdigit():
+            raise HTTPParseError(400, "Bad Request")
+
+        body_length = int(content_lengths.pop())
+        if body_length > self.__max_body_size:
+            raise HTTPParseError(413, "Content Too Large")
+
+        return body_length
@@ -0,0 +1,64 @@
+from typing import List, Optional, Tuple
+
+
+class ParseRange:
+    @classmethod
+    def execute(
+        cls, range_header: str, size: int, max_ranges: int = 16
+    ) -> Optional[List[Tuple[int, int]]]:
+        # (offset, length) of every range, sorted and with overlapping or
+        # adjacent ones merged. None when the header must be ignored and the
+        # whole file sent, empty when nothing in it can be satisfied
+        unit, _, range_specs = range_header.partition("=")
+
+        if unit.strip().lower() != "bytes" or not range_specs.strip():
+            return None
+
+        ranges = []
+
+        for range_spec in range_specs.split(","):
+            first, dash, last = range_spec.strip().partition("-")
+            first, last = first.strip(), last.strip()
+
+            if not dash:
+                return None
+
+            if not first:
+                # The last bytes of the file
+                if not last.isdigit():
+                    return None
+
+                if int(last) and size:
+                    ranges.append((max(size - int(last), 0), size - 1))
+
+                continue
+
+            if not first.isdigit() or (last and not last.isdigit()):
+                return None
+
+            start = int(first)
+            end = int(last) if last else size - 1
+
+            if last and end < start:
+                return None
+
+            if start < size:
+                ranges.append((start, min(end, size - 1)))
+
+        merged_ranges: List[Tuple[int, int]] = []
+
+        for start, end in sorted(ranges):
+            if merged_ranges and start <= merged_ranges[-1][1] + 1:
+                merged_ranges[-1] = (
+                    merged_ranges[-1][0],
+                    max(merged_ranges[-1][1], end),
+                )
+
+            else:
+                merged_ranges.append((start, end))
+
+        # Asking for many small pieces of a file only costs us work
+        if len(merged_ranges) > max_ranges:
+            return None
+
+        return [(start, end - start + 1) for start, end in merged_ranges]
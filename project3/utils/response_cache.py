@@ -0,0 +1,224 @@
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Optional, Tuple
+
+import hashlib
+import os
+import threading
+
+
+class CachedResponse:
+    def __init__(
+        self,
+        key: Tuple[str, str, int, int, int],
+        head: bytes,
+        not_modified_head: bytes,
+        content_type: str,
+        validators: bytes,
+        etag: str,
+        last_modified: int,
+        size: int,
+        body: Optional[bytes] = None,
+        fd: Optional[int] = None,
+    ) -> None:
+        self.key = key
+
+        # Status line and headers, without the connection headers and the
+        # blank line that ends them. The 304 one only has the validators
+        self.head = head
+        self.not_modified_head = not_modified_head
+
+        # For the heads of partial responses, built per request
+        self.content_type = content_type
+        self.validators = validators
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+
+        # Small files are kept whole, large ones as a descriptor to sendfile
+        self.body = body
+        self.fd = fd
+        self.references = 0
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+
+
+class CachedResponseHandle:
+    def __init__(
+        self, response_cache: "ResponseCache", cached_response: CachedResponse
+    ) -> None:
+        self.__response_cache = response_cache
+        self.__cached_response = cached_response
+
+    def __enter__(self) -> CachedResponse:
+        return self.__cached_response
+
+    def __exit__(self, *_) -> None:
+        self.__response_cache.release(self.__cached_response)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_body_size: int = 1024 * 1024,
+        max_entries: int = 1024,
+    ) -> None:
+        # Bodies held in memory count against max_bytes, descriptors
+        # against max_entries
+        self.__max_bytes = max_bytes
+        self.__max_body_size = max_body_size
+        self.__max_entries = max_entries
+        self.__cached_bytes = 0
+        self.__lock = threading.Lock()
+
+        # Least recently used first
+        self.__entries: "OrderedDict[Tuple[str, str], CachedResponse]" = OrderedDict()
+
+    def open(
+        self, file_path: str, status: str, content_type: str, cache_control: str
+    ) -> CachedResponseHandle:
+        return CachedResponseHandle(
+            response_cache=self,
+            cached_response=self.acquire(
+                file_path=file_path,
+                status=status,
+                content_type=content_type,
+                cache_control=cache_control,
+            ),
+        )
+
+    def acquire(
+        self, file_path: str, status: str, content_type: str, cache_control: str
+    ) -> CachedResponse:
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        entry_key = (file_path, status)
+        key = (file_path, status, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self.__lock:
+            cached_response = self.__entries.get(entry_key)
+
+            if cached_response is not None and cached_response.key == key:
+                self.__entries.move_to_end(entry_key)
+
+            else:
+                if cached_response is not None:
+                    # The file changed on disk, requests still sending the
+                    # old response keep it until they are done
+                    self.__forget(cached_response)
+
+                cached_response = self.__load(
+                    key=key,
+                    status=status,
+                    content_type=content_type,
+                    cache_control=cache_control,
+                )
+                self.__entries[entry_key] = cached_response
+                self.__cached_bytes += len(cached_response.body or b"")
+
+            cached_response.references += 1
+            self.__evict()
+
+            return cached_response
+
+    def release(self, cached_response: CachedResponse) -> None:
+        with self.__lock:
+            cached_response.references -= 1
+
+            if self.__entries.get(cached_response.key[:2]) is not cached_response:
+                if cached_response.references == 0:
+                    cached_response.close()
+
+            else:
+                self.__evict()
+
+    def __load(
+        self,
+        key: Tuple[str, str, int, int, int],
+        status: str,
+        content_type: str,
+        cache_control: str,
+    ) -> CachedResponse:
+        fd = os.open(key[0], os.O_RDONLY | getattr(os, "O_BINARY", 0))
+
+        try:
+            size = os.fstat(fd).st_size
+            body = None
+
+            if size <= self.__max_body_size:
+                with os.fdopen(fd, "rb", closefd=False) as f:
+                    body = f.read(size)
+
+                os.close(fd)
+                fd = None
+                size = len(body)
+
+        except (OSError, ValueError):
+            # Directories and special files open but can't be read
+            if fd is not None:
+                os.close(fd)
+            raise
+
+        # Bodies in memory are hashed once, large files are told apart by
+        # size and modification time, which is what a hash would cost to read
+        if body is None:
+            etag = f'"{key[4]:x}-{key[3]:x}"'
+
+        else:
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+        last_modified = key[3] // 1_000_000_000
+        validators = (
+            f"ETag: {etag}\r\n"
+            f"Last-Modified: {formatdate(last_modified, usegmt=True)}\r\n"
+            f"Cache-Control: {cache_control}\r\n"
+        )
+
+        # Only successful responses can be asked for in pieces
+        accept_ranges = "Accept-Ranges: bytes\r\n" if status.startswith("200") else ""
+
+        head = (
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {size}\r\n"
+            f"{accept_ranges}"
+            f"{validators}"
+        ).encode("utf-8")
+        not_modified_head = (f"HTTP/1.1 304 Not Modified\r\n{validators}").encode(
+            "utf-8"
+        )
+
+        return CachedResponse(
+            key=key,
+            head=head,
+            not_modified_head=not_modified_head,
+            content_type=content_type,
+            validators=validators.encode("utf-8"),
+            etag=etag,
+            last_modified=last_modified,
+            size=size,
+            body=body,
+            fd=fd,
+        )
+
+    def __forget(self, cached_response: CachedResponse) -> None:
+        del self.__entries[cached_response.key[:2]]
+        self.__cached_bytes -= len(cached_response.body or b"")
+
+        if cached_response.references == 0:
+            cached_response.close()
+
+    def __evict(self) -> None:
+        for cached_response in list(self.__entries.values()):
+            if (
+                self.__cached_bytes <= self.__max_bytes
+                and len(self.__entries) <= self.__max_entries
+            ):
+                break
+
+            # Responses being sent are never dropped
+            if cached_response.references == 0:
+                self.__forget(cached_response)
@@ -0,0 +1,81 @@
+import errno
+import os
+import select
+import socket
+import threading
+
+# sendfile refuses these file and socket combinations, the data is then
+# copied through userspace instead
+SENDFILE_UNSUPPORTED_ERRORS = {
+    errno.EINVAL,
+    errno.ENOSYS,
+    getattr(errno, "ENOTSUP", errno.EINVAL),
+    getattr(errno, "EOPNOTSUPP", errno.EINVAL),
+}
+
+
+class SendFile:
+    FALLBACK_BUFFER_SIZE = 1024 * 1024
+
+    # Guards the shared file offset on platforms without pread
+    __seek_lock = threading.Lock()
+
+    @classmethod
+    def execute(cls, sock: socket.socket, fd: int, offset: int, length: int) -> None:
+        sent = 0
+
+        if hasattr(os, "sendfile"):
+            try:
+                # The kernel copies straight from the page cache to the
+                # socket, with an explicit offset so fd can be shared
+                while sent < length:
+                    try:
+                        sent_bytes = os.sendfile(
+                            sock.fileno(), fd, offset + sent, length - sent
+                        )
+
+                    except BlockingIOError:
+                        cls.__wait_writable(sock=sock)
+                        continue
+
+                    if not sent_bytes:
+                        raise EOFError("File shrank while being sent")
+
+                    sent += sent_bytes
+
+                return
+
+            except OSError as e:
+                if e.errno not in SENDFILE_UNSUPPORTED_ERRORS:
+                    raise
+
+        while sent < length:
+            chunk = cls.__read(
+                fd=fd,
+                offset=offset + sent,
+                length=min(cls.FALLBACK_BUFFER_SIZE, length - sent),
+            )
+
+            if not chunk:
+                raise EOFError("File shrank while being sent")
+
+            sock.sendall(chunk)
+            sent += len(chunk)
+
+    @classmethod
+    def __wait_writable(cls, sock: socket.socket) -> None:
+        # Sockets with a timeout are non-blocking underneath, so sendfile
+        # gives up when the send buffer is full instead of waiting
+        _, writable, _ = select.select([], [sock], [], sock.gettimeout())
+
+        if not writable:
+            raise socket.timeout("timed out")
+
+    @classmethod
+    def __read(cls, fd: int, offset: int, length: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(fd, length, offset)
+
+        with cls.__seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, length)